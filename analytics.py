@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 Chenrui Lei
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import sys
+from array import array
+from multiprocessing import Pool
+from replay import ReplayReader
+
+
+class MatchStats:
+    """Aggregates of one or more recorded matches, mergeable across files.
+
+    Per robot id it keeps ``shots``, enemy ``hits``, ``damage_dealt`` to
+    enemies, ``damage_taken``, and seconds spent in zones by zone type. Robot
+    positions are counted per tick into a ``heatmap`` of ``cell_size``
+    cells, one flat row-major ``array('d')`` per robot.
+
+    """
+
+    def __init__(self, map_width, map_height, cell_size=250):
+        self.map_width = map_width
+        self.map_height = map_height
+        self.cell_size = cell_size
+        self.cols = int(-(-map_width // cell_size))
+        self.rows = int(-(-map_height // cell_size))
+        self.matches = 0
+        self.robots = {}
+        self.heatmaps = {}
+
+    def robot(self, robot_id):
+        stats = self.robots.get(robot_id)
+        if stats is None:
+            stats = self.robots[robot_id] = {
+                'shots': 0, 'hits': 0, 'damage_dealt': 0, 'damage_taken': 0,
+                'zone_time': {}
+            }
+            self.heatmaps[robot_id] = array('d', bytes(8 * self.cols * self.rows))
+        return stats
+
+    def merge(self, other):
+        self.matches += other.matches
+        for robot_id, stats in other.robots.items():
+            mine = self.robot(robot_id)
+            for key in ('shots', 'hits', 'damage_dealt', 'damage_taken'):
+                mine[key] += stats[key]
+            for zone_type, seconds in stats['zone_time'].items():
+                mine['zone_time'][zone_type] = \
+                    mine['zone_time'].get(zone_type, 0) + seconds
+            heatmap = self.heatmaps[robot_id]
+            for index, count in enumerate(other.heatmaps[robot_id]):
+                if count:
+                    heatmap[index] += count
+        return self
+
+    def rows_table(self):
+        """One summary row per robot, sorted by robot id."""
+        rows = []
+        for robot_id in sorted(self.robots):
+            stats = self.robots[robot_id]
+            rows.append({
+                'robot': robot_id,
+                'shots': stats['shots'],
+                'hits': stats['hits'],
+                'accuracy': stats['hits'] / stats['shots'] if stats['shots'] else 0.0,
+                'damage_dealt': stats['damage_dealt'],
+                'damage_taken': stats['damage_taken'],
+                'defence_time': stats['zone_time'].get('defence', 0.0),
+                'supply_time': stats['zone_time'].get('supply', 0.0)
+            })
+        return rows
+
+
+_configs = {}
+
+
+def _load_config(config_path):
+    # Zone types and robot ids are not in the replay, they come from the map
+    if config_path not in _configs:
+        try:
+            with open(config_path, 'r') as f:
+                _configs[config_path] = json.load(f)['config']
+        except (OSError, ValueError, KeyError):
+            _configs[config_path] = None
+    return _configs[config_path]
+
+
+def analyze_replay(path, cell_size=250):
+    """Stream one replay file into a :obj:`MatchStats`.
+
+    Records are read one at a time and only the current robot and zone
+    state is kept, so memory does not grow with the match length.
+
+    """
+    with ReplayReader(path) as reader:
+        t_interval = reader.t_interval
+        config = _load_config(reader.header['config_path'])
+        if config is None:
+            raise ValueError(
+                "{:}: map config {:} not found".format(
+                    path, reader.header['config_path']
+                )
+            )
+        stats = MatchStats(config['map_width'], config['map_height'], cell_size)
+        stats.matches = 1
+        robot_ids = [robot['robot_id'] for robot in config['robots']]
+        zone_types = {zone['id']: zone['type'] for zone in config['zones']}
+        for robot_id in robot_ids:
+            stats.robot(robot_id)
+        heatmaps = [stats.heatmaps[robot_id] for robot_id in robot_ids]
+        cols = stats.cols
+        rows = stats.rows
+
+        positions = None
+        zones = {}
+        shooters = {}
+        last_tick = None
+
+        def accumulate(ticks, dt):
+            # The current state held for ``ticks`` ticks of ``dt`` seconds
+            if ticks <= 0:
+                return
+            for slot, (x, y) in enumerate(positions):
+                col = min(max(int(x // cell_size), 0), cols - 1)
+                row = min(max(int(y // cell_size), 0), rows - 1)
+                heatmaps[slot][row * cols + col] += ticks
+            for zone_id, robots in zones.items():
+                zone_type = zone_types.get(zone_id, 'unknown')
+                for robot_id in robots:
+                    zone_time = stats.robot(robot_id)['zone_time']
+                    zone_time[zone_type] = \
+                        zone_time.get(zone_type, 0) + ticks * dt
+
+        for kind, tick, data in reader.records():
+            dt = t_interval
+            if kind == 'K':
+                if last_tick is not None:
+                    accumulate(tick - last_tick - 1, t_interval)
+                positions = [(robot[0], robot[1]) for robot in data['robots']]
+                zones = {zone[0]: zone[5] for zone in data['zones']}
+                events = data.get('events', ())
+            else:
+                dt = data.get('t_interval', t_interval)
+                accumulate(tick - last_tick - 1, t_interval)
+                for slot, changed in data.get('robots', {}).items():
+                    if 0 in changed or 1 in changed:
+                        x, y = positions[slot]
+                        positions[slot] = (changed.get(0, x), changed.get(1, y))
+                for zone in data.get('zones', ()):
+                    zones[zone[0]] = zone[5]
+                events = data.get('events', ())
+            if last_tick is not None:
+                accumulate(1, dt)
+            last_tick = tick
+
+            for event in events:
+                if event[0] == 'fire':
+                    _, robot_id, bullet_id = event
+                    stats.robot(robot_id)['shots'] += 1
+                    shooters[bullet_id] = robot_id
+                elif event[0] == 'wall':
+                    shooters.pop(event[1], None)
+                elif event[0] == 'hit':
+                    _, bullet_id, target, damage = event
+                    stats.robot(target)['damage_taken'] += damage
+                    shooter = shooters.pop(bullet_id, None)
+                    if shooter is not None and shooter[0] != target[0]:
+                        stats.robot(shooter)['hits'] += 1
+                        stats.robot(shooter)['damage_dealt'] += damage
+    return stats
+
+
+def _analyze(args):
+    path, cell_size = args
+    return analyze_replay(path, cell_size)
+
+
+def analyze_batch(paths, processes=None, cell_size=250):
+    """Analyze many replay files in parallel and merge the results.
+
+    Args:
+        paths (:obj:`list` of :obj:`str`): Replay files of one batch.
+        processes (:obj:`int`): Worker processes, ``os.cpu_count()`` by
+            default. 1 runs in this process.
+        cell_size (:obj:`int or float`): Heatmap cell size in millimeter.
+
+    Returns:
+        :obj:`MatchStats`: The merged statistics.
+
+    """
+    jobs = [(path, cell_size) for path in paths]
+    total = None
+    if processes == 1:
+        for stats in map(_analyze, jobs):
+            total = stats if total is None else total.merge(stats)
+    else:
+        with Pool(processes) as pool:
+            for stats in pool.imap_unordered(_analyze, jobs):
+                total = stats if total is None else total.merge(stats)
+    return total
+
+
+def format_table(rows):
+    """Render summary rows as a fixed width text table."""
+    columns = (
+        ('robot', '{:}'), ('shots', '{:}'), ('hits', '{:}'),
+        ('accuracy', '{:.3f}'), ('damage_dealt', '{:}'),
+        ('damage_taken', '{:}'), ('defence_time', '{:.1f}'),
+        ('supply_time', '{:.1f}')
+    )
+    cells = [[name for name, _ in columns]] + [
+        [fmt.format(row[name]) for name, fmt in columns] for row in rows
+    ]
+    widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+    return '\n'.join(
+        '  '.join(cell.rjust(width) for cell, width in zip(line, widths))
+        for line in cells
+    )
+
+
+if __name__ == "__main__":
+    # python analytics.py <replay files>
+    total = analyze_batch(sys.argv[1:])
+    if total is None:
+        print("no replay files given")
+    else:
+        print("{:} matches".format(total.matches))
+        print(format_table(total.rows_table()))
@@ -0,0 +1,517 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 Chenrui Lei
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import math
+
+
+class WallEdges:
+    """Wall edges compiled once into flat lists for batched segment tests.
+
+    Walls are bucketed into a uniform grid by their bounding boxes, so a
+    segment only tests the edges of walls sharing a cell with it.
+
+    """
+
+    def __init__(self, walls=(), cell_size=1000):
+        """Wall edges constructor.
+
+        Args:
+            walls (:obj:`list` of :obj:`Wall`): The walls to compile.
+            cell_size (:obj:`int or float`): Broadphase grid cell size in
+                millimeter.
+
+        """
+        self.cell_size = cell_size
+        # Edge start point and edge vector, four edges per wall
+        self.ax = []
+        self.ay = []
+        self.ex = []
+        self.ey = []
+        self.bounds = []
+        self.cells = {}
+        for wall in walls:
+            self.add_wall(wall)
+
+    def add_wall(self, wall):
+        """Compile one more wall, returns its wall index."""
+        wall_index = len(self.bounds)
+        for edges in (self.ax, self.ay, self.ex, self.ey):
+            edges.extend((0.0, 0.0, 0.0, 0.0))
+        self.bounds.append(None)
+        self.set_wall(wall_index, wall)
+        return wall_index
+
+    def set_wall(self, wall_index, wall):
+        """Recompile the wall at an index, e.g. after it was moved."""
+        self._unbucket(wall_index)
+        cos = math.cos(wall.pose.orientation.z)
+        sin = math.sin(wall.pose.orientation.z)
+        ox = wall.pose.position.x
+        oy = wall.pose.position.y
+        corners = [
+            (ox + x*cos - y*sin, oy + x*sin + y*cos)
+            for x, y in ((0, 0), (wall.length, 0),
+                         (wall.length, -wall.width), (0, -wall.width))
+        ]
+        for i in range(4):
+            x0, y0 = corners[i]
+            x1, y1 = corners[(i + 1) % 4]
+            edge = 4 * wall_index + i
+            self.ax[edge] = x0
+            self.ay[edge] = y0
+            self.ex[edge] = x1 - x0
+            self.ey[edge] = y1 - y0
+
+        xs = [x for x, _ in corners]
+        ys = [y for _, y in corners]
+        bounds = (min(xs), max(xs), min(ys), max(ys))
+        self.bounds[wall_index] = bounds
+        for cell in self._cells_of(*bounds):
+            self.cells.setdefault(cell, []).append(wall_index)
+
+    def copy(self):
+        """Independent copy, e.g. to edit walls shared with another world."""
+        edges = WallEdges.__new__(WallEdges)
+        edges.cell_size = self.cell_size
+        edges.ax = list(self.ax)
+        edges.ay = list(self.ay)
+        edges.ex = list(self.ex)
+        edges.ey = list(self.ey)
+        edges.bounds = list(self.bounds)
+        edges.cells = {cell: list(indices) for cell, indices in self.cells.items()}
+        return edges
+
+    def remove_wall(self, wall_index):
+        """Drop a wall from the grid. Its index stays reserved."""
+        self._unbucket(wall_index)
+        self.bounds[wall_index] = None
+
+    def _unbucket(self, wall_index):
+        bounds = self.bounds[wall_index]
+        if bounds is None:
+            return
+        for cell in self._cells_of(*bounds):
+            self.cells[cell].remove(wall_index)
+
+    def candidates(self, xmin, xmax, ymin, ymax):
+        """Indices of walls sharing a grid cell with the given bounds."""
+        indices = set()
+        for cell in self._cells_of(xmin, xmax, ymin, ymax):
+            indices.update(self.cells.get(cell, ()))
+        return sorted(indices)
+
+    def _cells_of(self, xmin, xmax, ymin, ymax):
+        size = self.cell_size
+        for row in range(int(ymin // size), int(ymax // size) + 1):
+            for col in range(int(xmin // size), int(xmax // size) + 1):
+                yield (col, row)
+
+    def first_hits(self, segments):
+        """Intersect a batch of motion segments with all wall edges.
+
+        Args:
+            segments (:obj:`list`): ``(x0, y0, x1, y1)`` per moving point.
+
+        Returns:
+            :obj:`list`: Per segment, ``(wall_index, t)`` of the first wall
+            edge crossed, with ``t`` in [0, 1] along the segment, or ``None``.
+
+        """
+        ax = self.ax
+        ay = self.ay
+        ex = self.ex
+        ey = self.ey
+        bounds = self.bounds
+        cells = self.cells
+        hits = []
+        for x0, y0, x1, y1 in segments:
+            dx = x1 - x0
+            dy = y1 - y0
+            sxmin = min(x0, x1)
+            sxmax = max(x0, x1)
+            symin = min(y0, y1)
+            symax = max(y0, y1)
+
+            candidates = set()
+            for cell in self._cells_of(sxmin, sxmax, symin, symax):
+                candidates.update(cells.get(cell, ()))
+
+            best_t = 2.0
+            best_wall = None
+            for wall_index in candidates:
+                bxmin, bxmax, bymin, bymax = bounds[wall_index]
+                if sxmax < bxmin or sxmin > bxmax or \
+                        symax < bymin or symin > bymax:
+                    continue
+                for edge in range(4 * wall_index, 4 * wall_index + 4):
+                    exx = ex[edge]
+                    eyy = ey[edge]
+                    denom = dx*eyy - dy*exx
+                    if denom == 0:
+                        continue
+                    qx = ax[edge] - x0
+                    qy = ay[edge] - y0
+                    t = (qx*eyy - qy*exx) / denom
+                    if t < 0 or t > 1 or t >= best_t:
+                        continue
+                    u = (qx*dy - qy*dx) / denom
+                    if 0 <= u <= 1:
+                        best_t = t
+                        best_wall = wall_index
+            hits.append(None if best_wall is None else (best_wall, best_t))
+        return hits
+
+
+class OrientedBox:
+    """Rectangle given by its center, half extents and local axes."""
+
+    def __init__(self, center_x, center_y, half_x, half_y, angle):
+        """Oriented box constructor.
+
+        Args:
+            center_x (:obj:`int or float`): Center x in millimeter.
+            center_y (:obj:`int or float`): Center y in millimeter.
+            half_x (:obj:`int or float`): Half extent along the local x axis.
+            half_y (:obj:`int or float`): Half extent along the local y axis.
+            angle (:obj:`float`): Rotation of the local x axis in radians.
+
+        """
+        self.center_x = center_x
+        self.center_y = center_y
+        self.half_x = half_x
+        self.half_y = half_y
+        self.angle = angle
+        self.cos = math.cos(angle)
+        self.sin = math.sin(angle)
+
+    def set_pose(self, center_x, center_y, angle):
+        """Move the box, recomputing its axes only if the angle changed."""
+        self.center_x = center_x
+        self.center_y = center_y
+        if angle != self.angle:
+            self.angle = angle
+            self.cos = math.cos(angle)
+            self.sin = math.sin(angle)
+
+    @classmethod
+    def from_wall(cls, wall):
+        """Box of a wall, whose pose is the corner of its ``length`` side."""
+        cos = math.cos(wall.pose.orientation.z)
+        sin = math.sin(wall.pose.orientation.z)
+        # Local center is (length/2, -width/2)
+        cx = wall.length/2
+        cy = -wall.width/2
+        return cls(
+            wall.pose.position.x + cx*cos - cy*sin,
+            wall.pose.position.y + cx*sin + cy*cos,
+            wall.length/2, wall.width/2, wall.pose.orientation.z
+        )
+
+    def closest_point(self, x, y):
+        dx = x - self.center_x
+        dy = y - self.center_y
+        lx = min(max(dx*self.cos + dy*self.sin, -self.half_x), self.half_x)
+        ly = min(max(-dx*self.sin + dy*self.cos, -self.half_y), self.half_y)
+        return (
+            self.center_x + lx*self.cos - ly*self.sin,
+            self.center_y + lx*self.sin + ly*self.cos
+        )
+
+
+def circle_box_contacts(x, y, radius, boxes):
+    """Closed-form circle test against many oriented boxes.
+
+    Args:
+        x (:obj:`int or float`): Circle center x.
+        y (:obj:`int or float`): Circle center y.
+        radius (:obj:`int or float`): Circle radius.
+        boxes (:obj:`list` of :obj:`OrientedBox`): The boxes to test.
+
+    Returns:
+        :obj:`list`: ``(box_index, depth, normal_x, normal_y)`` for every box
+        the circle penetrates. The normal points from the box to the circle
+        and moving the circle by ``depth`` along it separates the two.
+
+    """
+    contacts = []
+    for index, box in enumerate(boxes):
+        cos = box.cos
+        sin = box.sin
+        hx = box.half_x
+        hy = box.half_y
+        dx = x - box.center_x
+        dy = y - box.center_y
+        lx = dx*cos + dy*sin
+        ly = -dx*sin + dy*cos
+        if abs(lx) >= hx + radius or abs(ly) >= hy + radius:
+            continue
+
+        cx = min(max(lx, -hx), hx)
+        cy = min(max(ly, -hy), hy)
+        if cx != lx or cy != ly:
+            # Center outside of the box, push away from the closest point
+            ox = lx - cx
+            oy = ly - cy
+            distance = math.sqrt(ox*ox + oy*oy)
+            if distance >= radius:
+                continue
+            depth = radius - distance
+            nlx = ox / distance
+            nly = oy / distance
+        else:
+            # Center inside of the box, push out through the nearest face
+            gap_x = hx - abs(lx)
+            gap_y = hy - abs(ly)
+            if gap_x < gap_y:
+                depth = gap_x + radius
+                nlx = 1.0 if lx >= 0 else -1.0
+                nly = 0.0
+            else:
+                depth = gap_y + radius
+                nlx = 0.0
+                nly = 1.0 if ly >= 0 else -1.0
+
+        contacts.append((index, depth, nlx*cos - nly*sin, nlx*sin + nly*cos))
+    return contacts
+
+
+def push_circle_out(x, y, radius, boxes, iterations=4):
+    """Slide a circle out of the boxes it penetrates.
+
+    The deepest contact is resolved first along its normal, which keeps the
+    tangential part of the motion, and the test is repeated for corners.
+
+    Returns:
+        :obj:`tuple`: ``(x, y, resolved)``, ``resolved`` is False if the
+        circle still penetrates a box after ``iterations`` pushes.
+
+    """
+    for _ in range(iterations):
+        contacts = circle_box_contacts(x, y, radius, boxes)
+        if not contacts:
+            return x, y, True
+        _, depth, nx, ny = max(contacts, key=lambda contact: contact[1])
+        # A hair more than the depth, so the circle ends up just outside
+        depth += 1e-6
+        x += nx * depth
+        y += ny * depth
+    return x, y, not circle_box_contacts(x, y, radius, boxes)
+
+
+def box_box_contact(a, b):
+    """Separating axis test between two oriented boxes.
+
+    Args:
+        a (:obj:`OrientedBox`): First box.
+        b (:obj:`OrientedBox`): Second box.
+
+    Returns:
+        :obj:`tuple`: ``(depth, normal_x, normal_y)`` of the smallest overlap,
+        with the normal pointing from ``a`` to ``b``, or ``None`` if the boxes
+        are separated.
+
+    """
+    dx = b.center_x - a.center_x
+    dy = b.center_y - a.center_y
+    best_depth = None
+    for ux, uy in ((a.cos, a.sin), (-a.sin, a.cos),
+                   (b.cos, b.sin), (-b.sin, b.cos)):
+        radius_a = a.half_x*abs(a.cos*ux + a.sin*uy) + \
+            a.half_y*abs(-a.sin*ux + a.cos*uy)
+        radius_b = b.half_x*abs(b.cos*ux + b.sin*uy) + \
+            b.half_y*abs(-b.sin*ux + b.cos*uy)
+        distance = dx*ux + dy*uy
+        depth = radius_a + radius_b - abs(distance)
+        if depth <= 0:
+            return None
+        if best_depth is None or depth < best_depth:
+            best_depth = depth
+            if distance < 0:
+                ux = -ux
+                uy = -uy
+            best_normal = (ux, uy)
+    return (best_depth, best_normal[0], best_normal[1])
+
+
+class CollisionWorld:
+    """Owns the collision shapes of a game and answers batched queries.
+
+    Static shapes are walls, kept both as edges for segment queries and as
+    oriented boxes for circle queries, and bucketed once into a uniform grid.
+    Dynamic shapes are robots, tested by their bounding circles first and by
+    their body rectangles only for the pairs left.
+
+    """
+
+    def __init__(self, cell_size=1000):
+        """Collision world constructor.
+
+        Args:
+            cell_size (:obj:`int or float`): Static broadphase grid cell size
+                in millimeter.
+
+        """
+        self.wall_edges = WallEdges(cell_size=cell_size)
+        self.static_boxes = []
+        self.static_walls = [] # by static index, None once removed
+        self.dynamic = []
+        self.query_counts = {
+            'point': 0, 'segment': 0, 'circle': 0, 'polygon': 0
+        }
+
+    def fork(self, robots):
+        """World sharing the static shapes, with its own dynamic ones."""
+        world = CollisionWorld.__new__(CollisionWorld)
+        world.wall_edges = self.wall_edges
+        world.static_boxes = self.static_boxes
+        world.static_walls = self.static_walls
+        world.dynamic = list(robots)
+        world.query_counts = dict.fromkeys(self.query_counts, 0)
+        return world
+
+    def own_static(self):
+        """Copy the static shapes shared with forks before changing them."""
+        self.wall_edges = self.wall_edges.copy()
+        self.static_boxes = list(self.static_boxes)
+        self.static_walls = list(self.static_walls)
+
+    def add_static(self, wall):
+        self.wall_edges.add_wall(wall)
+        self.static_boxes.append(wall.box)
+        self.static_walls.append(wall)
+
+    def replace_static(self, old_wall, new_wall):
+        """Swap a wall for another one in place, keeping its static index."""
+        index = self.static_walls.index(old_wall)
+        self.wall_edges.set_wall(index, new_wall)
+        self.static_boxes[index] = new_wall.box
+        self.static_walls[index] = new_wall
+
+    def remove_static(self, wall):
+        index = self.static_walls.index(wall)
+        self.wall_edges.remove_wall(index)
+        self.static_boxes[index] = None
+        self.static_walls[index] = None
+
+    def add_dynamic(self, robot):
+        self.dynamic.append(robot)
+
+    def remove_dynamic(self, robot):
+        self.dynamic.remove(robot)
+
+    def _static_near(self, x, y, radius):
+        indices = self.wall_edges.candidates(
+            x - radius, x + radius, y - radius, y + radius
+        )
+        return indices, [self.static_boxes[index] for index in indices]
+
+    def query_points(self, points):
+        """Find the dynamic shape hit by each point.
+
+        Args:
+            points (:obj:`list`): ``(x, y)`` per point.
+
+        Returns:
+            :obj:`list`: Per point, the first robot whose bounding circle
+            contains it, or ``None``.
+
+        """
+        self.query_counts['point'] += len(points)
+        circles = [
+            (robot, robot.pose.position.x, robot.pose.position.y, robot.radius)
+            for robot in self.dynamic
+        ]
+        hits = []
+        for x, y in points:
+            hit = None
+            for robot, rx, ry, radius in circles:
+                if (x - rx)**2 + (y - ry)**2 < radius**2:
+                    hit = robot
+                    break
+            hits.append(hit)
+        return hits
+
+    def query_segments(self, segments):
+        """First static hit per motion segment, see :meth:`WallEdges.first_hits`."""
+        self.query_counts['segment'] += len(segments)
+        return self.wall_edges.first_hits(segments)
+
+    def query_circles(self, circles):
+        """Static contacts of a batch of circles.
+
+        Args:
+            circles (:obj:`list`): ``(x, y, radius)`` per circle.
+
+        Returns:
+            :obj:`list`: Per circle, the ``(static_index, depth, normal_x,
+            normal_y)`` contacts, see :func:`circle_box_contacts`.
+
+        """
+        self.query_counts['circle'] += len(circles)
+        result = []
+        for x, y, radius in circles:
+            indices, boxes = self._static_near(x, y, radius)
+            result.append([
+                (indices[i], depth, nx, ny)
+                for i, depth, nx, ny in circle_box_contacts(x, y, radius, boxes)
+            ])
+        return result
+
+    def resolve_circle(self, x, y, radius):
+        """Slide a circle out of the static shapes, see :func:`push_circle_out`."""
+        self.query_counts['circle'] += 1
+        _, boxes = self._static_near(x, y, radius)
+        return push_circle_out(x, y, radius, boxes)
+
+    def query_polygons(self, robots):
+        """Find the dynamic shape each robot body overlaps.
+
+        Args:
+            robots (:obj:`list` of :obj:`Robot`): The robots to test.
+
+        Returns:
+            :obj:`list`: Per robot, the first other robot whose body
+            rectangle overlaps it, or ``None``.
+
+        """
+        self.query_counts['polygon'] += len(robots)
+        hits = []
+        for robot in robots:
+            x = robot.pose.position.x
+            y = robot.pose.position.y
+            radius = robot.radius
+            hit = None
+            for other in self.dynamic:
+                if other is robot:
+                    continue
+                reach = radius + other.radius
+                if (other.pose.position.x - x)**2 + \
+                        (other.pose.position.y - y)**2 >= reach**2:
+                    continue
+                if box_box_contact(robot.body_box(), other.body_box()) is not None:
+                    hit = other
+                    break
+            hits.append(hit)
+        return hits
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 Chenrui Lei
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import math
+import random
+from collections import namedtuple
+from game import Game
+from observation import ObservationBuffer
+
+
+# Plain description of an observation or action space. ``low``/``high`` are
+# per column bounds, ``fields`` the column names.
+Space = namedtuple('Space', ['shape', 'dtype', 'low', 'high', 'fields'])
+
+
+class GameEnv:
+    """Reset/step environment around :obj:`Game`.
+
+    One environment drives all robots. An action is one
+    ``(linear_x, linear_y, angular_z, fire)`` row per robot slot, the
+    observation is the float32 :obj:`ObservationBuffer` of all slots.
+
+    The reward is one value per robot slot, in bullets: the damage the robot
+    dealt to enemies minus the damage it took, both divided by
+    ``per_bullet_demage``. When the match is decided every robot of the
+    winning team gets ``win_reward`` and every robot of the other team
+    loses it.
+
+    """
+
+    def __init__(self, config_path='map_config.json', t_interval=0.02,
+                 frame_skip=5, max_episode_ticks=None, win_reward=10.0,
+                 k_bullets=4, k_walls=4, max_linear=3000, max_angular=2*math.pi,
+                 random_spawn=False, seed=None, rules=None):
+        """Environment constructor.
+
+        Args:
+            config_path (:obj:`str`): The game config JSON file.
+            t_interval (:obj:`int or float`): Physics step in seconds.
+            frame_skip (:obj:`int`): Physics steps per :meth:`step`, run
+                inside :meth:`Game.step` with the action held.
+            max_episode_ticks (:obj:`int`): Physics steps after which an
+                episode is cut off, unlimited by default.
+            win_reward (:obj:`int or float`): Terminal reward, see above.
+            k_bullets (:obj:`int`): See :obj:`ObservationBuffer`.
+            k_walls (:obj:`int`): See :obj:`ObservationBuffer`.
+            max_linear (:obj:`int or float`): Advertised linear speed bound.
+            max_angular (:obj:`int or float`): Advertised turn rate bound.
+            random_spawn (:obj:`bool`): Start episodes with robots at random
+                collision-free poses instead of their map coordinates.
+            seed (:obj:`int`): Seed of the spawn sampling.
+            rules (:obj:`MatchRules`): When an episode is decided, see
+                :obj:`Game`.
+
+        """
+        self.t_interval = t_interval
+        self.frame_skip = frame_skip
+        self.max_episode_ticks = max_episode_ticks
+        self.win_reward = win_reward
+
+        self.game = Game(config_path, rules)
+        self.game.create_observation_buffer(k_bullets, k_walls)
+        # Resets restore this snapshot instead of reloading the map
+        self._initial_state = self.game.get_state()
+        self._slots = {robot.id: slot for slot, robot in enumerate(self.game.robots)}
+        self._shooters = {}
+        self.random_spawn = random_spawn
+        self.rng = random.Random(seed)
+        self._spawn_states = []
+
+        buffer = self.game.observation_buffer
+        fields = ObservationBuffer.ROBOT_FIELDS + \
+            ObservationBuffer.BULLET_FIELDS * k_bullets + \
+            ObservationBuffer.WALL_FIELDS * k_walls
+        self.observation_space = Space(
+            buffer.shape, 'float32',
+            (-math.inf,) * buffer.record_size, (math.inf,) * buffer.record_size,
+            fields
+        )
+        self.action_space = Space(
+            (len(self.game.robots), len(Game.action_fields)), 'float32',
+            (-max_linear, -max_linear, -max_angular, 0),
+            (max_linear, max_linear, max_angular, 1),
+            Game.action_fields
+        )
+
+    @property
+    def robot_ids(self):
+        return [robot.id for robot in self.game.robots]
+
+    def reset(self, state=None):
+        """Start a new episode.
+
+        Args:
+            state (:obj:`dict`): A :meth:`Game.get_state` snapshot to start
+                from. By default the initial map state, with random robot
+                poses if ``random_spawn`` is set.
+
+        Returns:
+            :obj:`memoryview`: The observation. It is overwritten in place by
+            the next step, copy it to keep it.
+
+        """
+        if state is None:
+            state = self._initial_state
+            if self.random_spawn:
+                if not self._spawn_states:
+                    # Draw a batch, one sampling call serves many resets
+                    self._spawn_states = self.game.random_states(
+                        64, self._initial_state, self.rng
+                    )
+                state = self._spawn_states.pop()
+        self.game.set_state(state)
+        self._shooters = {}
+        return self.game.observation
+
+    def step(self, action):
+        """Hold one action for ``frame_skip`` physics steps.
+
+        Args:
+            action: One row per robot slot, see :meth:`Game.apply_actions`.
+
+        Returns:
+            :obj:`tuple`: ``(observation, rewards, done, info)``. ``rewards``
+            has one entry per robot slot, ``info`` holds the ``events`` of
+            all skipped steps, the ``winner`` team or ``None`` and whether
+            the episode was ``truncated``.
+
+        """
+        game = self.game
+        events = game.step(action, self.t_interval, self.frame_skip)
+
+        rewards = [0.0] * len(game.robots)
+        for event in events:
+            if event[0] == 'fire':
+                self._shooters[event[2]] = event[1]
+            elif event[0] == 'wall':
+                self._shooters.pop(event[1], None)
+            elif event[0] == 'hit':
+                _, bullet_id, target, damage = event
+                bullets = damage / game.per_bullet_demage
+                rewards[self._slots[target]] -= bullets
+                shooter = self._shooters.pop(bullet_id, None)
+                if shooter is not None and shooter[0] != target[0]:
+                    rewards[self._slots[shooter]] += bullets
+
+        outcome = game.outcome()
+        done = outcome is not None
+        winner = None
+        if done:
+            winner = outcome['winner']
+            for slot, robot in enumerate(game.robots):
+                if winner == 'draw':
+                    continue
+                if robot.id[0] == winner:
+                    rewards[slot] += self.win_reward
+                else:
+                    rewards[slot] -= self.win_reward
+
+        truncated = not done and self.max_episode_ticks is not None and \
+            game.tick >= self.max_episode_ticks
+        return game.observation, rewards, done or truncated, {
+            'events': events, 'winner': winner, 'truncated': truncated
+        }
+
+    def close(self):
+        self.game.observation_buffer.close()
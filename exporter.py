@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 Chenrui Lei
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import math
+import os
+import subprocess
+from multiprocessing import Pool
+from render import SceneRenderer
+
+
+COLOR_NAMES = {
+    'black': (0, 0, 0),
+    'white': (255, 255, 255),
+    'red': (255, 0, 0),
+    'blue': (0, 0, 255),
+}
+
+
+def parse_color(color):
+    """Tk color string to an RGB bytes triple, ``None`` for no color."""
+    if not color:
+        return None
+    if color in COLOR_NAMES:
+        return bytes(COLOR_NAMES[color])
+    digits = color.lstrip('#')
+    if len(digits) == 3:
+        digits = ''.join(c * 2 for c in digits)
+    return bytes.fromhex(digits)
+
+
+class FrameRaster:
+    """Offscreen RGB24 frame that draws scene primitives.
+
+    Shapes are filled by scanlines, each span written with one slice
+    assignment, so a frame does not need any imaging library.
+
+    """
+
+    background = (255, 255, 255)
+
+    def __init__(self, width, height):
+        self.width = int(math.ceil(width))
+        self.height = int(math.ceil(height))
+        self.pixels = bytearray(bytes(self.background) * (self.width * self.height))
+
+    def _span(self, y, x0, x1, rgb):
+        if y < 0 or y >= self.height:
+            return
+        x0 = max(int(round(x0)), 0)
+        x1 = min(int(round(x1)), self.width)
+        if x1 <= x0:
+            return
+        start = 3 * (y * self.width + x0)
+        self.pixels[start:start + 3 * (x1 - x0)] = rgb * (x1 - x0)
+
+    def fill_polygon(self, coords, rgb):
+        points = list(zip(coords[0::2], coords[1::2]))
+        ys = [y for _, y in points]
+        for y in range(max(int(min(ys)), 0), min(int(max(ys)) + 1, self.height)):
+            scan_y = y + 0.5
+            xs = []
+            for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1]):
+                if (y0 <= scan_y < y1) or (y1 <= scan_y < y0):
+                    xs.append(x0 + (scan_y - y0) * (x1 - x0) / (y1 - y0))
+            xs.sort()
+            for i in range(0, len(xs) - 1, 2):
+                self._span(y, xs[i], xs[i + 1], rgb)
+
+    def stroke_polygon(self, coords, rgb, width=1):
+        points = list(zip(coords[0::2], coords[1::2]))
+        half = max(width, 1) / 2
+        for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1]):
+            length = math.hypot(x1 - x0, y1 - y0)
+            if length == 0:
+                continue
+            # Thick line as a quad, extended by half the width at both ends
+            ux = (x1 - x0) / length * half
+            uy = (y1 - y0) / length * half
+            self.fill_polygon([
+                x0 - ux - uy, y0 - uy + ux,
+                x1 + ux - uy, y1 + uy + ux,
+                x1 + ux + uy, y1 + uy - ux,
+                x0 - ux + uy, y0 - uy - ux,
+            ], rgb)
+
+    def fill_oval(self, coords, rgb):
+        x0, y0, x1, y1 = coords
+        cx = (x0 + x1) / 2
+        cy = (y0 + y1) / 2
+        rx = (x1 - x0) / 2
+        ry = (y1 - y0) / 2
+        if rx <= 0 or ry <= 0:
+            return
+        for y in range(max(int(y0), 0), min(int(y1) + 1, self.height)):
+            dy = (y + 0.5 - cy) / ry
+            if abs(dy) > 1:
+                continue
+            dx = rx * math.sqrt(1 - dy * dy)
+            self._span(y, cx - dx, cx + dx, rgb)
+
+    def fill_rectangle(self, coords, rgb):
+        x0, y0, x1, y1 = coords
+        for y in range(max(int(round(y0)), 0), min(int(round(y1)), self.height)):
+            self._span(y, x0, x1, rgb)
+
+    def draw(self, scene):
+        for kind, coords, options in scene:
+            fill = parse_color(options.get('fill'))
+            # Tk draws rectangles with a black outline by default
+            outline = parse_color(options.get(
+                'outline', 'black' if kind == 'rectangle' else ''
+            ))
+            width = options.get('width', 1)
+            if kind == 'polygon':
+                if fill is not None:
+                    self.fill_polygon(coords, fill)
+                if outline is not None and (outline != fill or width > 1):
+                    self.stroke_polygon(coords, outline, width)
+            elif kind == 'oval':
+                self.fill_oval(coords, fill or outline)
+            elif kind == 'rectangle':
+                x0, y0, x1, y1 = coords
+                if outline is not None:
+                    self.fill_rectangle(coords, outline)
+                    x0 += 1
+                    y0 += 1
+                    x1 -= 1
+                    y1 -= 1
+                if fill is not None:
+                    self.fill_rectangle([x0, y0, x1, y1], fill)
+        return self.pixels
+
+
+def render_frame(job):
+    """Rasterize one ``(width, height, scene)`` job, for worker processes."""
+    width, height, scene = job
+    return bytes(FrameRaster(width, height).draw(scene))
+
+
+def write_ppm(path, width, height, pixels):
+    with open(path, 'wb') as f:
+        f.write('P6\n{:} {:}\n255\n'.format(width, height).encode('ascii'))
+        f.write(pixels)
+
+
+class MatchExporter:
+    """Renders matches to video frames offscreen, across a process pool.
+
+    Frames keep the layout of :obj:`GameUI`. The main process only simulates
+    and builds the light scene lists, the workers rasterize, and frames are
+    written back in order, either as a PPM image sequence or to the stdin
+    of a local encoder process.
+
+    """
+
+    def __init__(self, map, robot_top_health, width=800, processes=None,
+                 chunksize=8):
+        """Match exporter constructor.
+
+        Args:
+            map (:obj:`Map`): The game map.
+            robot_top_health (:obj:`int`): Health of a full health bar.
+            width (:obj:`int`): Arena width in pixels, as for :obj:`GameUI`.
+            processes (:obj:`int`): Worker processes, by default one per CPU.
+            chunksize (:obj:`int`): Frames handed to a worker at a time.
+
+        """
+        self.renderer = SceneRenderer(map, robot_top_health, width)
+        self.frame_width = int(math.ceil(self.renderer.canvas_width))
+        self.frame_height = int(math.ceil(self.renderer.canvas_height))
+        self.chunksize = chunksize
+        self.pool = Pool(processes)
+
+    def scene(self, game):
+        return self.renderer.draw(game.game_objects)
+
+    def export_scenes(self, scenes, output_dir=None, encoder=None, fps=50):
+        """Render recorded scenes in order.
+
+        Args:
+            scenes: Iterable of scenes, see :obj:`SceneRenderer`.
+            output_dir (:obj:`str`): Write ``frame_000000.ppm`` files here.
+            encoder (:obj:`list` of :obj:`str`): Command reading raw RGB24
+                frames from stdin, ``{width}``, ``{height}`` and ``{fps}`` are
+                filled in, e.g. ``['ffmpeg', '-y', '-f', 'rawvideo',
+                '-pix_fmt', 'rgb24', '-s', '{width}x{height}', '-r', '{fps}',
+                '-i', '-', 'match.mp4']``.
+            fps (:obj:`int`): Frame rate passed to the encoder.
+
+        Returns:
+            :obj:`int`: Number of frames written.
+
+        """
+        if (output_dir is None) == (encoder is None):
+            raise ValueError("Give exactly one of output_dir and encoder.")
+
+        process = None
+        if encoder is not None:
+            command = [
+                arg.format(width=self.frame_width, height=self.frame_height,
+                           fps=fps)
+                for arg in encoder
+            ]
+            process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        else:
+            os.makedirs(output_dir, exist_ok=True)
+
+        jobs = (
+            (self.frame_width, self.frame_height, scene) for scene in scenes
+        )
+        count = 0
+        try:
+            for pixels in self.pool.imap(render_frame, jobs, self.chunksize):
+                if process is not None:
+                    process.stdin.write(pixels)
+                else:
+                    write_ppm(
+                        os.path.join(output_dir, 'frame_{:06d}.ppm'.format(count)),
+                        self.frame_width, self.frame_height, pixels
+                    )
+                count += 1
+        finally:
+            if process is not None:
+                process.stdin.close()
+                process.wait()
+        return count
+
+    def export_game(self, game, policy, ticks, t_interval=0.02, frame_skip=1,
+                    **output):
+        """Simulate a game under a policy and render it.
+
+        Args:
+            game (:obj:`Game`): The game to run, it is advanced in place.
+            policy: Called with the game before every tick, returns action
+                rows for :meth:`Game.apply_actions`, or ``None`` to keep the
+                current commands.
+            ticks (:obj:`int`): Ticks to simulate.
+            t_interval (:obj:`int or float`): Simulation step in seconds.
+            frame_skip (:obj:`int`): Render one frame every this many ticks.
+            **output: ``output_dir``, ``encoder`` and ``fps`` as for
+                :meth:`export_scenes`.
+
+        """
+        def scenes():
+            for tick in range(ticks):
+                if tick % frame_skip == 0:
+                    yield self.scene(game)
+                actions = policy(game)
+                if actions is not None:
+                    game.apply_actions(actions)
+                game.update(t_interval)
+
+        return self.export_scenes(scenes(), **output)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
@@ -23,26 +23,58 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import copy
 import time
 import math
 import json
-from copy import deepcopy
+import random
 from map import Map
+from navigation import NavigationGraph, FlowField
+from zone_tracker import ZoneTracker
+from observation import ObservationBuffer
+from visibility import TeamVisibility
+from spawn import SpawnSet
+from match_rules import MatchRules
 from game_objects import GameObject, Bullet, Wall, Robot, Zone, Polygon, Circle
 from physics import Vector2D, Vector3D, Orient2D, Pose2D, Velocity2D, Acceleration2D, Movement2D
-from collision_engine_2d import CollisionEngine2D, LineSegment2D, Point2D, Line2D
+from collision import CollisionWorld
+from run_loop import RunLoop
 
 class Game:
     """The game backgound core"""
 
-    def __init__(self, config_path):
+    # Columns of an :meth:`apply_actions` row
+    action_fields = ('linear_x', 'linear_y', 'angular_z', 'fire')
+
+    def __init__(self, config_path, rules=None):
         """Game constructor.
 
         Args:
             config_path (:obj:`str`): The path to the game config JSON file.
+            rules (:obj:`MatchRules`): When the match ends, the default
+                :obj:`MatchRules` if not given.
 
         """
         self.game_objects = []
+        # Objects that move, robots and bullets. Walls and zones never enter
+        # the integration loop.
+        self.dynamic_objects = []
+        self.zones = []
+        self.robots = [] # robot slots, in the order robots were added
+        self.robot_ids = {}
+        self.config_path = config_path
+        self.tick = 0
+        self.elapsed = 0.0 # simulated seconds
+        # Events of the last update, see update()
+        self.events = []
+        self._pending_events = []
+        self._next_bullet_id = 0
+        self.rules = MatchRules() if rules is None else rules
+        self._outcome = None
+        # True while robots, bullets and zones are shared with a fork
+        self._shared = False
+        # All collision shapes, filled by add_game_object
+        self.collision_world = CollisionWorld()
 
         # Load json format map configration
         with open(config_path, 'r') as f:
@@ -59,31 +91,13 @@ class Game:
         # Create zones
         for zone in map_config['config']['zones']:
             self.add_game_object(
-                Zone(
-                    Pose2D(
-                        position=Vector2D(
-                            zone['coords']['x'],
-                            zone['coords']['y'],
-                        ),
-                        orientation=Orient2D(math.radians(zone['orientation']))
-                    ),
-                    map_config['config']['zone_side_length'],
-                    zone['id'],
-                    zone['type']
-                )
+                self._zone_from_config(zone, map_config['config'])
             )
 
         # Create walls
         for wall in map_config['config']['walls']:
             self.add_game_object(
-                Wall(
-                    Pose2D(
-                        position=Vector2D(wall['coords']['x'], wall['coords']['y']),
-                        orientation=Orient2D(math.radians(wall['orientation']))
-                    ),
-                    wall['length'],
-                    map_config['config']['wall_thickness']
-                )
+                self._wall_from_config(wall, map_config['config'])
             )
 
         # Create robots
@@ -105,28 +119,419 @@ class Game:
                 )
             )
 
+        # Navigation graph over walls inflated by robot size, see navigation
+        self._navigation = None
+
+        # Zone lookup grid for robot enter/exit events
+        self.zone_tracker = ZoneTracker(
+            self.map, [obj for obj in self.game_objects if type(obj) is Zone]
+        )
+
+        # Flow fields are built on first use, keyed by goal zone ids
+        self._flow_fields = {}
+        # Spawn sets are built on first use, keyed by robot size
+        self._spawn_sets = {}
+
+        self.observation_buffer = None
+        self.create_observation_buffer()
+
+        # Fog of war, see team_observation()
+        self.visibility = TeamVisibility(self.collision_world.wall_edges)
+        self._team_buffers = {}
+
+    @staticmethod
+    def _zone_from_config(zone, config):
+        return Zone(
+            Pose2D(
+                position=Vector2D(
+                    zone['coords']['x'],
+                    zone['coords']['y'],
+                ),
+                orientation=Orient2D(math.radians(zone['orientation']))
+            ),
+            config['zone_side_length'],
+            zone['id'],
+            zone['type']
+        )
+
+    @staticmethod
+    def _wall_from_config(wall, config):
+        return Wall(
+            Pose2D(
+                position=Vector2D(wall['coords']['x'], wall['coords']['y']),
+                orientation=Orient2D(math.radians(wall['orientation']))
+            ),
+            wall['length'],
+            config['wall_thickness'],
+            wall['id']
+        )
+
+    @property
+    def navigation(self):
+        """The navigation graph, rebuilt on first use after a map reload."""
+        if self._navigation is None:
+            self._navigation = NavigationGraph(
+                self.map,
+                [obj for obj in self.game_objects if type(obj) is Wall],
+                self.zones,
+                max([robot.radius for robot in self.robots], default=0)
+            )
+        return self._navigation
+
+    def reload_map(self, config_path=None):
+        """Apply an edited map config without restarting the game.
+
+        Walls and zones are matched by ``id``. Only walls that were added,
+        removed or changed are recompiled into the collision world, and
+        changed zones are moved in place so they keep their clocks and
+        buffs. Robots and bullets are left alone. The navigation graph,
+        flow fields and spawn sets are rebuilt on their next use. The map
+        and the static collision shapes are copied first, so forks keep the
+        map they were branched with.
+
+        Args:
+            config_path (:obj:`str`): The edited config, by default the one
+                the game was loaded from.
+
+        Returns:
+            :obj:`dict`: Ids of the ``added``, ``removed`` and ``changed``
+            entries, under ``'walls'`` and ``'zones'``.
+
+        """
+        if config_path is None:
+            config_path = self.config_path
+        with open(config_path, 'r') as f:
+            config = json.load(f)['config']
+        if self._shared:
+            self._own()
+
+        # Both may be shared with forks, even when this game owns its robots
+        old_map = self.map
+        self.map = Map(
+            config['map_width'], config['map_height'], config['wall_thickness']
+        )
+        map_changed = (old_map.width, old_map.height) != \
+            (self.map.width, self.map.height)
+        self.collision_world.own_static()
+
+        changes = {}
+        # Walls and zones stay in front of robots and bullets, as when loaded
+        first_dynamic = len(self.game_objects)
+        for index, obj in enumerate(self.game_objects):
+            if not obj.static:
+                first_dynamic = index
+                break
+
+        # Walls
+        walls = {
+            obj.id: obj for obj in self.game_objects if type(obj) is Wall
+        }
+        wall_configs = {wall['id']: wall for wall in config['walls']}
+        added, removed, changed = [], [], []
+        for wall_id, wall in walls.items():
+            if wall_id not in wall_configs:
+                self.game_objects.remove(wall)
+                self.collision_world.remove_static(wall)
+                first_dynamic -= 1
+                removed.append(wall_id)
+        for wall_id, wall_config in wall_configs.items():
+            new = self._wall_from_config(wall_config, config)
+            old = walls.get(wall_id)
+            if old is None:
+                self.game_objects.insert(first_dynamic, new)
+                self.collision_world.add_static(new)
+                first_dynamic += 1
+                added.append(wall_id)
+            elif (old.pose.position.x, old.pose.position.y,
+                  old.pose.orientation.z, old.length, old.width) != \
+                    (new.pose.position.x, new.pose.position.y,
+                     new.pose.orientation.z, new.length, new.width):
+                self.game_objects[self.game_objects.index(old)] = new
+                self.collision_world.replace_static(old, new)
+                changed.append(wall_id)
+        changes['walls'] = {'added': added, 'removed': removed, 'changed': changed}
+        walls_changed = bool(added or removed or changed)
+
+        # Zones
+        zone_configs = {zone['id']: zone for zone in config['zones']}
+        added, removed, changed = [], [], []
+        for zone in list(self.zones):
+            if zone.id not in zone_configs:
+                self.game_objects.remove(zone)
+                self.zones.remove(zone)
+                first_dynamic -= 1
+                removed.append(zone.id)
+        zones = {zone.id: zone for zone in self.zones}
+        for zone_id, zone_config in zone_configs.items():
+            new = self._zone_from_config(zone_config, config)
+            old = zones.get(zone_id)
+            if old is None:
+                self.game_objects.insert(first_dynamic, new)
+                self.zones.append(new)
+                first_dynamic += 1
+                added.append(zone_id)
+            elif (old.pose.position.x, old.pose.position.y,
+                  old.pose.orientation.z, old.side_length, old.type) != \
+                    (new.pose.position.x, new.pose.position.y,
+                     new.pose.orientation.z, new.side_length, new.type):
+                old.pose = new.pose
+                old.last_pose = new.last_pose
+                old.side_length = new.side_length
+                old.shape_set = new.shape_set
+                old.type = new.type
+                changed.append(zone_id)
+        changes['zones'] = {'added': added, 'removed': removed, 'changed': changed}
+        zones_changed = bool(added or removed or changed)
+
+        if walls_changed or zones_changed or map_changed:
+            self._navigation = None
+            self._flow_fields = {}
+        if walls_changed or map_changed:
+            self._spawn_sets = {}
+            self.observation_buffer.set_walls(
+                [obj for obj in self.game_objects if type(obj) is Wall]
+            )
+            self._team_buffers = {}
+            self.visibility = TeamVisibility(self.collision_world.wall_edges)
+        if zones_changed or map_changed:
+            # Fresh grids, memberships are re-checked on the next update
+            self.zone_tracker = ZoneTracker(self.map, self.zones)
+            self.zone_tracker.reset()
+        return changes
+
+    def create_observation_buffer(self, k_bullets=4, k_walls=4,
+                                  shared_memory_name=None):
+        """Replace the observation buffer filled by :meth:`update`.
+
+        Args:
+            k_bullets (:obj:`int`): Nearest bullets recorded per robot.
+            k_walls (:obj:`int`): Nearest walls recorded per robot.
+            shared_memory_name (:obj:`str`): Place the buffer in a named
+                shared memory block, see :obj:`ObservationBuffer`.
+
+        """
+        if self.observation_buffer is not None:
+            self.observation_buffer.close()
+        self._team_buffers = {}
+        self.observation_buffer = ObservationBuffer(
+            self.robots,
+            [obj for obj in self.game_objects if type(obj) is Wall],
+            k_bullets, k_walls, shared_memory_name
+        )
+        self.observation_buffer.fill(
+            self.robots,
+            [obj for obj in self.game_objects if type(obj) is Bullet]
+        )
+        return self.observation_buffer
+
+    @property
+    def observation(self):
+        """Memoryview on the float32 observation, see :obj:`ObservationBuffer`."""
+        return self.observation_buffer.view
+
+    def team_observation(self, team):
+        """Observation as seen by one team, with fog of war.
+
+        Enemy robots out of line of sight of every robot of the team are
+        all zeros, and enemy bullets out of sight are left out of the bullet
+        entries. The buffer has the same layout as :attr:`observation` and
+        is refilled in place on every call.
+
+        Args:
+            team (:obj:`str`): 'R' or 'B'.
+
+        Returns:
+            :obj:`memoryview`: The team's float32 observation.
+
+        """
+        bullets = [obj for obj in self.game_objects if type(obj) is Bullet]
+        visible_robots, visible_bullets = self.visibility.visible(
+            team, self.robots, bullets, self.tick
+        )
+
+        buffer = self._team_buffers.get(team)
+        if buffer is None:
+            buffer = ObservationBuffer(
+                self.robots,
+                [obj for obj in self.game_objects if type(obj) is Wall],
+                self.observation_buffer.k_bullets,
+                self.observation_buffer.k_walls
+            )
+            self._team_buffers[team] = buffer
+        buffer.fill(
+            self.robots,
+            [bullet for bullet in bullets if bullet.id in visible_bullets],
+            {
+                slot for slot, robot in enumerate(self.robots)
+                if robot.id not in visible_robots
+            }
+        )
+        return buffer.view
+
+    def plan(self, starts, goals):
+        """Batched path query, see :meth:`NavigationGraph.plan`."""
+        return self.navigation.plan(starts, goals)
+
+    def flow_field(self, zone_ids):
+        """Get the cached flow field toward the nearest of the given zones.
+
+        Args:
+            zone_ids (:obj:`list` of :obj:`str`): Goal zone ids.
+
+        """
+        key = tuple(sorted(zone_ids))
+        if key not in self._flow_fields:
+            zones = [
+                obj for obj in self.game_objects
+                if type(obj) is Zone and obj.id in key
+            ]
+            if len(zones) != len(key):
+                raise KeyError("Unknown zone id in {:}".format(list(key)))
+            self._flow_fields[key] = FlowField(
+                self.map, self.navigation.obstacles, zones
+            )
+        return self._flow_fields[key]
+
+    def friendly_flow_field(self, team, zone_types=('supply', 'defence')):
+        """Flow field toward the nearest zone of a team.
+
+        Args:
+            team (:obj:`str`): 'R' or 'B'.
+            zone_types (:obj:`tuple` of :obj:`str`): Zone types to consider.
+
+        """
+        return self.flow_field([
+            obj.id for obj in self.game_objects
+            if type(obj) is Zone and obj.team == team and obj.type in zone_types
+        ])
+
+    def spawn_set(self, length, width):
+        """Get the cached collision-free spawn positions of a robot size."""
+        key = (length, width)
+        if key not in self._spawn_sets:
+            self._spawn_sets[key] = SpawnSet(
+                self.map, [obj for obj in self.game_objects if type(obj) is Wall],
+                length, width
+            )
+        return self._spawn_sets[key]
+
+    def random_states(self, count, template=None, rng=random, max_tries=20):
+        """Initial states with every robot at a random spawn pose.
+
+        Args:
+            count (:obj:`int`): Number of states, e.g. one per environment.
+            template (:obj:`dict`): :meth:`get_state` snapshot the states are
+                based on, the current state by default. Robots keep their
+                health and ammo but start still, bullets are dropped.
+            rng (:obj:`random.Random`): Random source.
+            max_tries (:obj:`int`): Redraws of a robot overlapping an
+                earlier robot of the same state. A robot still overlapping
+                after all of them keeps its template pose.
+
+        Returns:
+            :obj:`list` of :obj:`dict`: States for :meth:`set_state`.
+
+        """
+        if template is None:
+            template = self.get_state()
+
+        # Draw all candidate poses per robot size at once
+        pools = {}
+        for robot in self.robots:
+            key = (robot.length, robot.width)
+            pools[key] = pools.get(key, 0) + count * max_tries
+        pools = {
+            key: self.spawn_set(*key).sample(size, rng)
+            for key, size in pools.items()
+        }
+
+        states = []
+        for _ in range(count):
+            placed = []
+            robots = []
+            for robot, values in zip(self.robots, template['robots']):
+                pool = pools[(robot.length, robot.width)]
+                for _ in range(max_tries):
+                    x, y, orientation = pool.pop()
+                    if all(
+                        (x - px)**2 + (y - py)**2 > (robot.radius + radius)**2
+                        for px, py, radius in placed
+                    ):
+                        break
+                else:
+                    # No free pose drawn, keep the robot where the template has it
+                    x, y, orientation = values[0], values[1], values[2]
+                placed.append((x, y, robot.radius))
+                robots.append(
+                    (x, y, orientation, 0.0, 0.0, 0.0) + tuple(values[6:])
+                )
+            state = dict(template)
+            state['robots'] = robots
+            state['bullets'] = []
+            states.append(state)
+        return states
+
     def fire(self, robot_id):
-        for obj in self.game_objects:
-            if type(obj) is Robot and obj.id==robot_id and obj.ammo > 0:
-                robot = obj
-
-                robot.ammo -= 1
-                self.add_game_object(
-                    Bullet(
-                        pose=robot.pose + Movement2D(
-                            Vector2D(robot.radius, 0).rotate(robot.pose.orientation.z),
-                            Orient2D(0)
-                        ),
-                        velocity=Velocity2D(
-                            Vector2D(20000, 0),
-                            Orient2D(0)
-                        ),
-                        team=robot.id,
-                        radius=50
-                    )
+        robot = self.robot_ids.get(robot_id)
+        if robot is not None:
+            self.fire_robot(robot)
+
+    def fire_robot(self, robot):
+        if self._outcome is not None:
+            return
+        if self._shared:
+            robot = self._own()[robot]
+        if robot.ammo > 0 and robot.health > 0:
+            robot.ammo -= 1
+            bullet_id = self._next_bullet_id
+            self._next_bullet_id += 1
+            self.add_game_object(
+                Bullet(
+                    pose=robot.pose + Movement2D(
+                        Vector2D(robot.radius, 0).rotate(robot.pose.orientation.z),
+                        Orient2D(0)
+                    ),
+                    velocity=Velocity2D(
+                        Vector2D(20000, 0),
+                        Orient2D(0)
+                    ),
+                    team=robot.id,
+                    radius=50,
+                    bullet_id=bullet_id
                 )
+            )
+            self._pending_events.append(('fire', robot.id, bullet_id))
+            self.visibility.invalidate()
+
+    def apply_actions(self, actions):
+        """Command all robots at once.
+
+        Args:
+            actions: One row per robot slot, in :attr:`robots` order. Each row
+                is ``(linear_x, linear_y, angular_z, fire)``, see
+                :attr:`action_fields`. Any sequence of rows works, including a
+                2D numpy array.
+
+        """
+        if self._shared:
+            self._own()
+        if len(actions) != len(self.robots):
+            raise ValueError(
+                "Got {:} action rows for {:} robots.".format(
+                    len(actions), len(self.robots)
+                )
+            )
+        for robot, action in zip(self.robots, actions):
+            velocity = robot.velocity
+            velocity.linear.x = float(action[0])
+            velocity.linear.y = float(action[1])
+            velocity.angular.z = float(action[2])
+            if action[3]:
+                self.fire_robot(robot)
 
     def add_game_object(self, obj):
+        if self._shared:
+            self._own()
         if not isinstance(obj, GameObject):
             raise TypeError(
                 "Cannot add '{:}' type as a game object.".format(
@@ -134,214 +539,482 @@ class Game:
                 )
             )
         self.game_objects.append(obj)
+        if not obj.static:
+            self.dynamic_objects.append(obj)
+        if type(obj) is Robot:
+            self.robots.append(obj)
+            self.robot_ids[obj.id] = obj
+            self.collision_world.add_dynamic(obj)
+        elif type(obj) is Wall:
+            self.collision_world.add_static(obj)
+        elif type(obj) is Zone:
+            self.zones.append(obj)
+
+
+    def step(self, actions, t_interval=0.02, repeat=1):
+        """Apply one action row per robot and hold it for ``repeat`` updates.
+
+        Shots are fired once, before the first update. The observation buffer
+        is only filled after the last update. Stops early once the match is
+        over.
+
+        Args:
+            actions: Rows as in :meth:`apply_actions`.
+            t_interval (:obj:`int or float`): Simulated seconds per update.
+            repeat (:obj:`int`): Number of updates.
+
+        Returns:
+            :obj:`list`: The :attr:`events` of all updates, in order.
+
+        """
+        self.apply_actions(actions)
+        events = []
+        for _ in range(repeat):
+            if self._outcome is not None:
+                break
+            self.update(t_interval, observe=False)
+            events += self.events
+        self._fill_observation()
+        return events
+
+    def update(self, t_interval, observe=True):
+        """The game update logic.
+
+        Afterwards :attr:`events` lists what happened, as tuples
+        ``('fire', robot_id, bullet_id)`` for shots issued since the previous
+        update, ``('wall', bullet_id)`` and
+        ``('hit', bullet_id, robot_id, damage)``.
+
+        Nothing happens any more once the match is over, see :meth:`is_done`.
+
+        Args:
+            t_interval (:obj:`int or float`): Simulated seconds.
+            observe (:obj:`bool`): Fill the observation buffer afterwards.
 
+        """
+        if self._outcome is not None:
+            self.events = []
+            return
+        if self._shared:
+            self._own()
+        self.events = self._pending_events
+        self._pending_events = []
+        self.tick += 1
+        self.elapsed += t_interval
+
+        # Zone clocks, zones themselves never move
+        for zone in self.zones:
+            zone.update_clock_and_buffs(t_interval)
+
+        # Update moving game objects
+        bullets = []
+        for game_obj in self.dynamic_objects:
+            if type(game_obj) is Robot and game_obj.health == 0:
+                # Destroyed robots stay where they are
+                continue
+            if type(game_obj) is Robot and game_obj.sleeping:
+                # Nothing to integrate or resolve until it gets a command
+                game_obj.update_buffs()
+                continue
 
-    def update(self, t_interval):
-        """The game update logic."""
-        # Update game objects
-        game_obj_index = 0
-        remove_indexs = []
-        for game_obj in self.game_objects:
-            old_pose = deepcopy(game_obj.pose)
             game_obj.update(t_interval)
 
             if type(game_obj) is Robot:
-                # Collision check
-                collision = False
-
-                for another_obj in self.game_objects:
-                    if type(another_obj) is Robot and \
-                    game_obj is not another_obj and \
-                    game_obj.pose.position.find_distance(
-                        another_obj.pose.position
-                    ) < game_obj.radius + another_obj.radius:
-                        # Collision with other robots
-                        # game_obj.moveTo(old_pose)
-                        collision = True
-                        break
+                # Collision with other robots
+                if self.collision_world.query_polygons([game_obj])[0] is not None:
+                    game_obj.restore_last_pose()
+                else:
+                    # Collision with walls, slide along them
+                    x, y, resolved = self.collision_world.resolve_circle(
+                        game_obj.pose.position.x, game_obj.pose.position.y,
+                        game_obj.radius
+                    )
+                    if resolved:
+                        game_obj.pose.position.x = x
+                        game_obj.pose.position.y = y
+                    else:
+                        game_obj.restore_last_pose()
 
+            elif type(game_obj) is Bullet:
+                bullets.append(game_obj)
 
+        # Bullet collision check, all bullets against all walls in one batch
+        red_defence = 0
+        blue_defence = 0
+        for robot in self.robots:
+            if robot.cancelled_damage != 0:
+                if robot.id[0] == 'R':
+                    red_defence = robot.cancelled_damage
+                elif robot.id[0] == 'B':
+                    blue_defence = robot.cancelled_damage
 
-                    if type(another_obj) is Wall:
-                        vertex = deepcopy(another_obj.shape_set[0].vertex)
-                        coords = []
-                        for v in vertex:
-                            if collision:
-                                break
-                            new_v = v.rotate(
-                                another_obj.pose.orientation.z
-                            )
-                            new_v += another_obj.pose.position
-
-                            if new_v.find_distance(
-                                game_obj.pose.position
-                            ) < game_obj.radius:
-                                # Collision with a wall corner
-                                collision = True
-                                break
-
-                            coords.append(new_v)
-
-                        edges = []
-                        for i in range(len(coords)):
-                            if collision:
-                                break
-                            new_line = LineSegment2D(
-                                Point2D(coords[i].x, coords[i].y),
-                                Point2D(coords[(i+1)%len(coords)].x, coords[(i+1)%len(coords)].y)
-                            )
-                            edges.append(new_line)
-
-                        for edge in edges:
-                            if collision:
-                                break
-                            perpendicular_line = edge.find_perpendicular(through_point=Point2D(
-                                game_obj.pose.position.x,
-                                game_obj.pose.position.y
-                            ))
-
-                            intersetion = perpendicular_line.find_intersection(edge)
-
-                            if intersetion!=False:
-                                xmax = max(edge.point1.x, edge.point2.x)
-                                xmin = min(edge.point1.x, edge.point2.x)
-                                ymax = max(edge.point1.y, edge.point2.y)
-                                ymin = min(edge.point1.y, edge.point2.y)
-
-                                if (intersetion.x <= xmax or \
-                                math.isclose(intersetion.x, xmax, rel_tol=1e-4)) \
-                                and (intersetion.x >= xmin or \
-                                math.isclose(intersetion.x, xmin, rel_tol=1e-4)) \
-                                and (intersetion.y <= ymax or \
-                                math.isclose(intersetion.y, ymax, rel_tol=1e-4)) \
-                                and (intersetion.y >= ymin or \
-                                math.isclose(intersetion.y, ymin, rel_tol=1e-4)) :
-
-                                    if edge.find_distance(
-                                        Point2D(
-                                            game_obj.pose.position.x,
-                                            game_obj.pose.position.y
-                                        )
-                                    ) < game_obj.radius:
-
-                                        # Collision with a wall edge
-                                        collision = True
-                                        break
-
-                if collision:
-                    game_obj.moveTo(old_pose)
+        wall_hits = self.collision_world.query_segments([
+            (
+                bullet.last_pose.position.x, bullet.last_pose.position.y,
+                bullet.pose.position.x, bullet.pose.position.y
+            )
+            for bullet in bullets
+        ])
+        robot_hits = self.collision_world.query_points([
+            (bullet.pose.position.x, bullet.pose.position.y)
+            for bullet in bullets
+        ])
 
+        removed_bullets = set()
+        for bullet, wall_hit, robot in zip(bullets, wall_hits, robot_hits):
+            if wall_hit is not None:
+                # Collision with a wall edge
+                print("Shot wall")
+                removed_bullets.add(bullet)
+                self.events.append(('wall', bullet.id))
+            elif robot is not None:
+                # Shot a robot
+                cancelled_damage = 0
+                if robot.id[0] == 'R':
+                    cancelled_damage = red_defence
+                elif robot.id[0] == 'B':
+                    cancelled_damage = blue_defence
 
-            elif type(game_obj) is Bullet:
-                # Bullet collision check
-                collision = False
-
-                red_defence = 0
-                blue_defence = 0
-                for obj in self.game_objects:
-                    if type(obj) is Robot:
-                        if obj.cancelled_damage != 0:
-                            if obj.id[0] == 'R':
-                                red_defence = obj.cancelled_damage
-                            elif obj.id[0] == 'B':
-                                blue_defence = obj.cancelled_damage
-                
-                for another_obj in self.game_objects:
-                    if type(another_obj) is Robot and \
-                    game_obj.pose.position.find_distance(
-                        another_obj.pose.position
-                    ) < another_obj.radius:
-                        # Shot a robot
-                        # Robot health deduction TODO
-                        cancelled_damage = 0
-                        if another_obj.id[0] == 'R':
-                            cancelled_damage = red_defence
-                        elif another_obj.id[0] == 'B':
-                            cancelled_damage = blue_defence
-
-                        print("Shot robot, damage: {}".format(self.per_bullet_demage - cancelled_damage))
-                        another_obj.health -= (self.per_bullet_demage - cancelled_damage)
-                        another_obj.health = max(another_obj.health, 0)  # Make not negtive health
-                        collision = True
-                        break
+                print("Shot robot, damage: {}".format(self.per_bullet_demage - cancelled_damage))
+                robot.health -= (self.per_bullet_demage - cancelled_damage)
+                robot.health = max(robot.health, 0)  # Make not negtive health
+                removed_bullets.add(bullet)
+                self.events.append((
+                    'hit', bullet.id, robot.id,
+                    self.per_bullet_demage - cancelled_damage
+                ))
+
+        if removed_bullets:
+            self.game_objects = [
+                obj for obj in self.game_objects if obj not in removed_bullets
+            ]
+            self.dynamic_objects = [
+                obj for obj in self.dynamic_objects if obj not in removed_bullets
+            ]
+
+        # Zone enter/exit events
+        alive = []
+        for robot in self.robots:
+            if robot.health > 0:
+                alive.append(robot)
+            else:
+                # Destroyed robots leave their zones and take no part in them
+                self.zone_tracker.drop(robot)
+        self.zone_tracker.update(alive)
 
+        self._outcome = self.rules.outcome(self)
 
-                    if type(another_obj) is Wall:
-                        vertex = deepcopy(another_obj.shape_set[0].vertex)
-                        coords = []
-                        for v in vertex:
-                            if collision:
-                                break
-                            new_v = v.rotate(
-                                another_obj.pose.orientation.z
-                            )
-                            new_v += another_obj.pose.position
-                            coords.append(new_v)
-
-                        edges = []
-                        for i in range(len(coords)):
-                            if collision:
-                                break
-                            new_line = LineSegment2D(
-                                Point2D(coords[i].x, coords[i].y),
-                                Point2D(coords[(i+1)%len(coords)].x, coords[(i+1)%len(coords)].y)
-                            )
-                            edges.append(new_line)
-
-                        for edge in edges:
-                            if collision:
-                                break
-                        
-                            if CollisionEngine2D.point_line_collision(
-                                point=Point2D(
-                                    game_obj.last_pose.position.x,
-                                    game_obj.last_pose.position.y
-                                ),
-                                point_movement=Point2D(
-                                    round((game_obj.pose-game_obj.last_pose).position.x),
-                                    round((game_obj.pose-game_obj.last_pose).position.y)
-                                ),
-                                line_segment=edge,
-                                line_segment_movement=Point2D(0, 0)
-                            ):
-
-                                # Collision with a wall edge
-                                print("Shot wall")
-                                collision = True
-                                break
-
-                        # exit()
-                
-                if collision:
-                    remove_indexs.append(game_obj_index)
-            elif type(game_obj) is Zone:
-                zone = game_obj
-                # find friend robot
-                for another_obj in self.game_objects:
-                    if type(another_obj) is Robot:
-
-                        if zone.type == 'defence':
-                            zone.handle_as_defence_zone(another_obj, t_interval)
-                        elif zone.type == 'supply':
-                            zone.handle_as_supply_zone(another_obj, t_interval)
-                    
-
-
-
-            game_obj_index += 1
-
-        for i in range(len(remove_indexs)-1, -1, -1):
-            self.game_objects.pop(remove_indexs[i])
-
-
-
-    def run(self):
-        update_time_interval = 1#0.01
-        while True:
-            self.update(update_time_interval)
-            time.sleep(update_time_interval)
-            # print('game is running')
-            print()
+        if observe:
+            self._fill_observation()
+
+    def _fill_observation(self):
+        self.observation_buffer.fill(
+            self.robots,
+            [obj for obj in self.dynamic_objects if type(obj) is Bullet]
+        )
+
+    def is_done(self):
+        """True once the match rules decided the match."""
+        return self._outcome is not None
+
+    def outcome(self):
+        """The result, see :meth:`MatchRules.outcome`, or ``None`` while playing."""
+        return self._outcome
+
+
+
+    def fork(self):
+        """Branch off an independent game that continues from this state.
+
+        Walls, the map, navigation, flow fields, spawn sets and collision
+        and zone lookup structures are shared. Robots, bullets and zones are
+        shared too until either game first changes them, e.g. through
+        :meth:`update` or :meth:`apply_actions`; only then that game copies
+        them. Forks can be stepped independently, also in other threads, and
+        pickled to other processes.
+
+        Returns:
+            :obj:`Game`: The new branch.
+
+        """
+        child = Game.__new__(Game)
+        child.__dict__.update(self.__dict__)
+        self._shared = True
+        child._shared = True
+        # Small per game buffers are copied right away
+        child.observation_buffer = copy.copy(self.observation_buffer)
+        child._team_buffers = {}
+        child.visibility = TeamVisibility(self.collision_world.wall_edges)
+        return child
+
+    def _own(self):
+        """Copy the robots, bullets and zones shared with forks.
+
+        Returns:
+            :obj:`dict`: Maps each previous robot to its copy.
+
+        """
+        self._shared = False
+        copies = {}
+        robot_map = {}
+        for obj in self.game_objects:
+            if obj.static and type(obj) is not Zone:
+                continue
+            new = copy.copy(obj)
+            for slot in ('pose', 'last_pose'):
+                pose = getattr(obj, slot)
+                setattr(new, slot, Pose2D(
+                    Vector2D(pose.position.x, pose.position.y),
+                    Orient2D(pose.orientation.z)
+                ))
+            if type(obj) is Robot:
+                # Robot velocities are changed in place by apply_actions
+                new.velocity = Velocity2D(
+                    Vector2D(obj.velocity.linear.x, obj.velocity.linear.y),
+                    Orient2D(obj.velocity.angular.z)
+                )
+                new.body = copy.copy(obj.body)
+                robot_map[obj] = new
+            copies[obj] = new
+        for zone in self.zones:
+            copies[zone].robots = [robot_map[robot] for robot in zone.robots]
+
+        self.game_objects = [copies.get(obj, obj) for obj in self.game_objects]
+        self.dynamic_objects = [copies[obj] for obj in self.dynamic_objects]
+        self.zones = [copies[zone] for zone in self.zones]
+        self.robots = [robot_map[robot] for robot in self.robots]
+        self.robot_ids = {robot.id: robot for robot in self.robots}
+        self.collision_world = self.collision_world.fork(self.robots)
+        self.zone_tracker = self.zone_tracker.fork(self.zones)
+        self.events = list(self.events)
+        self._pending_events = list(self._pending_events)
+        return robot_map
+
+    # Per robot fields of get_state()
+    robot_state_fields = (
+        'x', 'y', 'orientation', 'linear_x', 'linear_y', 'angular_z',
+        'health', 'ammo', 'cancelled_damage', 'buff_age'
+    )
+
+    def get_state(self):
+        """Snapshot of all mutable game state as plain data.
+
+        Timers are stored as ages in seconds, so a state can be restored
+        later with :meth:`set_state`.
+
+        Returns:
+            :obj:`dict`: ``tick``, ``elapsed``, ``next_bullet_id``,
+            ``robots`` (one :attr:`robot_state_fields` tuple per slot),
+            ``bullets`` (``(id, team, x, y, orientation, linear_x, linear_y,
+            radius)`` tuples) and ``zones`` (``(id, clock_age,
+            defence_buff_age, defence_buff_ready, supply_times_ready,
+            robot_ids)`` tuples).
+
+        """
+        now = time.time()
+        robots = []
+        for robot in self.robots:
+            robots.append((
+                robot.pose.position.x, robot.pose.position.y,
+                robot.pose.orientation.z,
+                robot.velocity.linear.x, robot.velocity.linear.y,
+                robot.velocity.angular.z,
+                robot.health, robot.ammo, robot.cancelled_damage,
+                now - robot.defence_buff_timer
+            ))
+        bullets = []
+        zones = []
+        for obj in self.game_objects:
+            if type(obj) is Bullet:
+                bullets.append((
+                    obj.id, obj.team,
+                    obj.pose.position.x, obj.pose.position.y,
+                    obj.pose.orientation.z,
+                    obj.velocity.linear.x, obj.velocity.linear.y,
+                    obj.radius
+                ))
+            elif type(obj) is Zone:
+                zones.append((
+                    obj.id, now - obj.clock, now - obj.defence_buff_timer,
+                    obj.defence_buff_ready, obj.supply_times_ready,
+                    tuple(robot.id for robot in obj.robots)
+                ))
+        return {
+            'tick': self.tick,
+            'elapsed': self.elapsed,
+            'next_bullet_id': self._next_bullet_id,
+            'robots': robots,
+            'bullets': bullets,
+            'zones': zones
+        }
+
+    def set_state(self, state):
+        """Restore a snapshot taken by :meth:`get_state` on the same map."""
+        if self._shared:
+            self._own()
+        now = time.time()
+        self.tick = state['tick']
+        self.elapsed = state['elapsed']
+        self._next_bullet_id = state['next_bullet_id']
+
+        for robot, values in zip(self.robots, state['robots']):
+            x, y, orientation, linear_x, linear_y, angular_z, \
+                health, ammo, cancelled_damage, buff_age = values
+            for pose in (robot.pose, robot.last_pose):
+                pose.position.x = x
+                pose.position.y = y
+                pose.orientation.z = orientation
+            robot.velocity = Velocity2D(
+                Vector2D(linear_x, linear_y), Orient2D(angular_z)
+            )
+            robot.health = health
+            robot.ammo = ammo
+            robot.cancelled_damage = cancelled_damage
+            robot.defence_buff_timer = now - buff_age
+
+        zones = {zone[0]: zone for zone in state['zones']}
+        for obj in self.game_objects:
+            if type(obj) is Zone and obj.id in zones:
+                _, clock_age, defence_buff_age, obj.defence_buff_ready, \
+                    obj.supply_times_ready, robot_ids = zones[obj.id]
+                obj.clock = now - clock_age
+                obj.defence_buff_timer = now - defence_buff_age
+                obj.robots = [self.robot_ids[robot_id] for robot_id in robot_ids]
+        self.zone_tracker.reset()
+
+        self.game_objects = [
+            obj for obj in self.game_objects if type(obj) is not Bullet
+        ]
+        self.dynamic_objects = [
+            obj for obj in self.dynamic_objects if type(obj) is not Bullet
+        ]
+        for bullet_id, team, x, y, orientation, linear_x, linear_y, radius \
+                in state['bullets']:
+            self.add_game_object(
+                Bullet(
+                    pose=Pose2D(Vector2D(x, y), Orient2D(orientation)),
+                    velocity=Velocity2D(
+                        Vector2D(linear_x, linear_y), Orient2D(0)
+                    ),
+                    team=team,
+                    radius=radius,
+                    bullet_id=bullet_id
+                )
+            )
+        self.events = []
+        self._pending_events = []
+        self.visibility.invalidate()
+        self._outcome = self.rules.outcome(self)
+        self._fill_observation()
+
+    def state_key(self, position_quantum=10, angle_quantum=math.radians(1),
+                  time_quantum=1.0):
+        """Build a hashable key from the quantized dynamic game state.
+
+        Two games whose robots, zones and bullets fall into the same
+        quantization buckets produce the same key, so planners can treat
+        them as one state. The key also holds whether the match is over and
+        the time left before the rules' time limit.
+
+        Args:
+            position_quantum (:obj:`int or float`): Position bucket size in
+                millimeter. Also used for linear velocities.
+            angle_quantum (:obj:`float`): Orientation bucket size in radians.
+                Also used for angular velocities.
+            time_quantum (:obj:`int or float`): Timer bucket size in seconds.
+
+        """
+        now = time.time()
+
+        def q_pos(value):
+            return int(round(value / position_quantum))
+
+        def q_angle(value):
+            return int(round((value % (2 * math.pi)) / angle_quantum))
+
+        def q_time(value):
+            return int(round(value / time_quantum))
+
+        robots = []
+        zones = []
+        bullets = []
+        for obj in self.game_objects:
+            if type(obj) is Robot:
+                buff_age = 0
+                if obj.cancelled_damage != 0:
+                    buff_age = q_time(now - obj.defence_buff_timer)
+                robots.append((
+                    obj.id,
+                    q_pos(obj.pose.position.x), q_pos(obj.pose.position.y),
+                    q_angle(obj.pose.orientation.z),
+                    q_pos(obj.velocity.linear.x), q_pos(obj.velocity.linear.y),
+                    int(round(obj.velocity.angular.z / angle_quantum)),
+                    obj.health, obj.ammo, obj.cancelled_damage, buff_age
+                ))
+            elif type(obj) is Zone:
+                zones.append((
+                    obj.id,
+                    q_time(now - obj.clock),
+                    q_time(now - obj.defence_buff_timer),
+                    obj.defence_buff_ready,
+                    obj.supply_times_ready,
+                    tuple(robot.id for robot in obj.robots)
+                ))
+            elif type(obj) is Bullet:
+                bullets.append((
+                    obj.team,
+                    q_pos(obj.pose.position.x), q_pos(obj.pose.position.y),
+                    q_angle(obj.pose.orientation.z),
+                    q_pos(obj.velocity.linear.x), q_pos(obj.velocity.linear.y)
+                ))
+        bullets.sort()
+
+        time_left = None
+        if self.rules.time_limit is not None:
+            # Rounded up, so only a match at its limit gets 0
+            time_left = int(math.ceil(
+                max(self.rules.time_limit - self.elapsed, 0) / time_quantum
+            ))
+        match = (self.is_done(), time_left)
+        return (tuple(robots), tuple(zones), tuple(bullets), match)
+
+    def state_hash(self, **quantums):
+        """Hash of :meth:`state_key`, see it for the quantization arguments."""
+        return hash(self.state_key(**quantums))
+
+    def run(self, mode='realtime', t_interval=1, hz=None, ticks=None,
+            callback=None):
+        """Run the game loop, see :obj:`RunLoop`.
+
+        Args:
+            mode (:obj:`str`): ``'realtime'`` or ``'max_speed'``. Step on
+                demand drivers use :meth:`RunLoop.step` directly.
+            t_interval (:obj:`int or float`): Simulated seconds per tick.
+            hz (:obj:`int or float`): Realtime target rate, by default
+                ``1 / t_interval``.
+            ticks (:obj:`int`): Number of ticks, required for ``'max_speed'``.
+            callback (:obj:`callable`): Called with the game after each tick.
+
+        Returns:
+            :obj:`dict`: :meth:`RunLoop.stats` of the run.
+
+        """
+        if mode == 'max_speed' and ticks is None:
+            raise ValueError("max_speed mode needs a number of ticks")
+        loop = RunLoop(self, t_interval, callback)
+        if mode == 'realtime':
+            stats = loop.run_realtime(hz, ticks, should_stop=Game.is_done)
+        elif mode == 'max_speed':
+            stats = loop.run_max_speed(ticks, should_stop=Game.is_done)
+        else:
+            raise ValueError("unknown run mode {:}".format(mode))
+        print("ran {ticks:} ticks at {achieved_hz:.1f} Hz, {overruns:} "
+              "overruns, {dropped:} dropped".format(**stats))
+        if self.is_done():
+            print("match over ({reason:}), winner: {winner:}".format(
+                **self._outcome
+            ))
+        return stats
 
 
 if __name__ == '__main__':
@@ -24,43 +24,117 @@
 # SOFTWARE.
 
 import math
-from copy import deepcopy
-from physics import dynamic_update, Movement2D, Vector2D, Orient2D, Pose2D, Velocity2D, Acceleration2D
+from functools import lru_cache
+from collision import OrientedBox
+from physics import dynamic_update, Vector2D, Orient2D, Pose2D, Velocity2D, Acceleration2D
 import time
 
 class Shape:
-    """Base class of geometry shape"""
-    def __init__(self, pose, type=[]):
-        self.pose = pose
-        self.type = type
+    """Base class of geometry shape.
+
+    Shapes are immutable and given in the frame of the object that owns them,
+    so objects of the same size share one instance, see the ``*_shapes``
+    functions below.
+
+    """
+    __slots__ = ()
+    type = 'shape'
+
+    def __setattr__(self, name, value):
+        raise AttributeError("shapes are shared and can not be modified")
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
 
 class Circle(Shape):
     """Circle shape class"""
-    def __init__(self, pose, radius):
-        Shape.__init__(self, pose)
-        self.type.append('circle')
-        self.radius = radius
+    __slots__ = ('radius',)
+    type = 'circle'
+
+    def __init__(self, radius):
+        object.__setattr__(self, 'radius', radius)
+
+    def __reduce__(self):
+        return (Circle, (self.radius,))
 
 
 class Polygon(Shape):
     """Polygon shape class"""
-    def __init__(self, pose, vertex):
-        Shape.__init__(self, pose)
-        self.type.append('poly')
-        self.vertex = vertex
+    __slots__ = ('vertex',)
+    type = 'poly'
+
+    def __init__(self, vertex):
+        object.__setattr__(self, 'vertex', tuple(
+            Vector2D(x, y) for x, y in vertex
+        ))
+
+    def __reduce__(self):
+        return (Polygon, (tuple((v.x, v.y) for v in self.vertex),))
+
+
+@lru_cache(maxsize=None)
+def wall_shapes(length, width):
+    return (
+        Polygon(((0, 0), (length, 0), (length, -width), (0, -width))),
+    )
+
+
+@lru_cache(maxsize=None)
+def zone_shapes(side_length):
+    return (
+        Polygon((
+            (0, 0), (side_length, 0),
+            (side_length, -side_length), (0, -side_length)
+        )),
+    )
+
+
+@lru_cache(maxsize=None)
+def robot_shapes(length, width):
+    return (
+        # Robot's rectangle body
+        Polygon((
+            (-length/2, width/2), (length/2, width/2),
+            (length/2, -width/2), (-length/2, -width/2)
+        )),
+        # Robot's canon
+        Polygon((
+            (0, width/20), (length*5/8, width/20),
+            (length*5/8, -width/20), (0, -width/20)
+        ))
+    )
+
+
+@lru_cache(maxsize=None)
+def bullet_shapes(radius):
+    return (Circle(radius),)
 
 
 class GameObject:
     """Base class of game object"""
 
-    def __init__(self, pose, velocity, acceleration, shape_set=[]):
+    # Static objects never move, so they skip integration and pose buffering
+    static = False
+
+    def __init__(self, pose, velocity, acceleration, shape_set=()):
         self.pose = pose
+        # Previous pose slot, swapped with ``pose`` on every update
+        self.last_pose = Pose2D(
+            Vector2D(pose.position.x, pose.position.y),
+            Orient2D(pose.orientation.z)
+        )
         self.velocity = velocity
         self.acceleration = acceleration
         self.shape_set = shape_set
 
     def update(self, t_interval=0.02):
+        if self.static:
+            return
+
         dx, vx = dynamic_update(
             self.velocity.linear.x, t_interval, self.acceleration.linear.x
         )
@@ -71,17 +145,37 @@ class GameObject:
             self.velocity.angular.z, t_interval, self.acceleration.angular.z
         )
 
-        # Perform movements
-        self.pose += Movement2D(
-            Vector2D(dx, dy).rotate(self.pose.orientation.z),
-            Orient2D(dz)
-        )
+        # Perform movements. The new pose is written into the previous slot
+        # and the slots are swapped, so the old pose is kept without copying.
+        current = self.pose
+        new_pose = self.last_pose
+        theta = current.orientation.z
+        cos = math.cos(theta)
+        sin = math.sin(theta)
+        new_pose.position.x = current.position.x + dx*cos - dy*sin
+        new_pose.position.y = current.position.y + dx*sin + dy*cos
+        new_pose.orientation.z = theta + dz
+        self.last_pose = current
+        self.pose = new_pose
 
         # Update physical status
         self.velocity = Velocity2D(
             Vector2D(vx, vy), Orient2D(vz)
         )
 
+    @property
+    def sleeping(self):
+        """True while the object can not move, it needs no integration."""
+        velocity = self.velocity
+        acceleration = self.acceleration
+        return velocity.linear.x == 0 and velocity.linear.y == 0 and \
+            velocity.angular.z == 0 and acceleration.linear.x == 0 and \
+            acceleration.linear.y == 0 and acceleration.angular.z == 0
+
+    def restore_last_pose(self):
+        """Undo the movement of the last update, e.g. on collision."""
+        self.pose, self.last_pose = self.last_pose, self.pose
+
 
     def move(self, offset):
         self.pose += offset
@@ -99,7 +193,9 @@ class GameObject:
 class Wall(GameObject):
     """Wall in game"""
 
-    def __init__(self, pose, length, width):
+    static = True
+
+    def __init__(self, pose, length, width, wall_id=None):
         velocity = Velocity2D(
             linear=Vector2D(0, 0),
             angular=Orient2D(0)
@@ -108,26 +204,19 @@ class Wall(GameObject):
             linear=Vector2D(0, 0),
             angular=Orient2D(0)
         )
-        shape_set = [
-            Polygon(
-                Pose2D(
-                    Vector2D(0, 0),
-                    Orient2D(0)
-                ),
-                vertex=[
-                    Vector2D(0, 0),
-                    Vector2D(length, 0),
-                    Vector2D(length, -width),
-                    Vector2D(0, -width),
-                ]
-            )
-        ]
+        shape_set = wall_shapes(length, width)
         GameObject.__init__(self, pose, velocity, acceleration, shape_set)
+        self.id = wall_id
+        self.length = length
+        self.width = width
+        self.box = OrientedBox.from_wall(self)
 
 
 class Zone(GameObject):
     """Zone in game"""
 
+    static = True
+
     def __init__(self, pose, side_length, zone_id, zone_type):
         velocity = Velocity2D(
             linear=Vector2D(0, 0),
@@ -137,20 +226,7 @@ class Zone(GameObject):
             linear=Vector2D(0, 0),
             angular=Orient2D(0)
         )
-        shape_set = [
-            Polygon(
-                Pose2D(
-                    Vector2D(0, 0),
-                    Orient2D(0)
-                ),
-                vertex=[
-                    Vector2D(0, 0),
-                    Vector2D(side_length, 0),
-                    Vector2D(side_length, -side_length),
-                    Vector2D(0, -side_length),
-                ]
-            )
-        ]
+        shape_set = zone_shapes(side_length)
         zone_team = zone_id[0] # 'R' or 'B'
 
         GameObject.__init__(self, pose, velocity, acceleration, shape_set)
@@ -167,9 +243,14 @@ class Zone(GameObject):
         self.defence_buff_ready = 1
 
         self.supply_times_ready = 2
-        self.added_ammo = False
-        self.robot = None # cache the robot which is in this zone
+        self.robots = [] # robots inside, kept up to date by ZoneTracker
     
+    @property
+    def center(self):
+        return self.pose.position + Vector2D(
+            self.side_length/2, -self.side_length/2
+        ).rotate(self.pose.orientation.z)
+
     def is_robot_inside(self, robot):
         in_left_border=(self.pose.position.x + robot.width/2 < robot.pose.position.x)
         in_right_border=(self.pose.position.x + self.side_length > robot.pose.position.x + robot.width/2)
@@ -195,61 +276,56 @@ class Zone(GameObject):
     def is_friendly(self, robot):
         return robot.id[0] == self.team
 
-    def handle_as_defence_zone(self, robot, t_interval):
-        now = time.time()
-        if self.is_robot_inside(robot) and self.is_friendly(robot):
-            self.robot = robot
-            if now - self.defence_buff_timer > 5 and self.defence_buff_ready > 0:
-                print("\n### waited for 5 seconds.\n")
-                self.robot.start_buff_defence()
-                self.defence_buff_ready -= 1
-                self.defence_buff_timer = now
-        elif self.robot is None or robot.id == self.robot.id:
-            # the robot left the self. 
-            self.defence_buff_timer = now
-            self.robot = None
-    
-    def handle_as_supply_zone(self, robot, t_interval):
-        if self.is_robot_inside(robot):
-            self.robot = robot
-            if self.supply_times_ready > 0 and not self.added_ammo:
+    def on_robot_enter(self, robot):
+        """Called once when a robot moves into the zone."""
+        self.robots.append(robot)
+        if self.type == 'defence':
+            if self.is_friendly(robot) and len(self.friendly_robots()) == 1:
+                # Start waiting for the buff as the first friend arrives
+                self.defence_buff_timer = time.time()
+        elif self.type == 'supply':
+            if self.supply_times_ready > 0:
                 print("\n### adding ammo to <{}>\n".format(robot.id))
                 self.supply_times_ready -= 1
                 robot.ammo += 50
-                self.added_ammo = True
-            elif not self.added_ammo:
+            else:
                 print("\n### no more ammo to supply.\n")
-                self.added_ammo = True
-        elif self.robot is None or robot.id == self.robot.id:
-            # this robot has left the zone.
-            self.added_ammo = False
-            self.robot = None
+
+    def on_robot_exit(self, robot):
+        """Called once when a robot moves out of the zone."""
+        self.robots.remove(robot)
+
+    def friendly_robots(self):
+        return [robot for robot in self.robots if self.is_friendly(robot)]
+
+    def update_occupied(self):
+        """Per-tick logic, only needed while some robot is inside."""
+        if self.type != 'defence':
+            return
+        friends = self.friendly_robots()
+        if not friends:
+            return
+        now = time.time()
+        if now - self.defence_buff_timer > 5 and self.defence_buff_ready > 0:
+            print("\n### waited for 5 seconds.\n")
+            friends[0].start_buff_defence()
+            self.defence_buff_ready -= 1
+            self.defence_buff_timer = now
 
 
 class Bullet(GameObject):
     """Bullet in game"""
 
-    def __init__(self, pose, velocity, team, radius=17/2):
+    def __init__(self, pose, velocity, team, radius=17/2, bullet_id=None):
         acceleration = Acceleration2D(
             linear=Vector2D(0, 0),
             angular=Orient2D(0)
         )
-        shape_set = [
-            Circle(
-                Pose2D(
-                    Vector2D(0, 0),
-                    Orient2D(0)
-                ),
-                radius=radius
-            )
-        ]
-        GameObject.__init__(self, pose, velocity, acceleration)
+        shape_set = bullet_shapes(radius)
+        GameObject.__init__(self, pose, velocity, acceleration, shape_set)
         self.radius = radius
         self.team = team
-
-    def update(self, t_interval):
-        self.last_pose = deepcopy(self.pose)
-        GameObject.update(self, t_interval)
+        self.id = bullet_id
 
 
 class Robot(GameObject):
@@ -264,37 +340,15 @@ class Robot(GameObject):
             linear=Vector2D(0, 0),
             angular=Orient2D(0)
         )
-        shape_set = [
-            # Robot's rectangle body
-            Polygon(
-                Pose2D(
-                    Vector2D(0, 0),
-                    Orient2D(0)
-                ),
-                vertex=[
-                    Vector2D(-length/2, width/2),
-                    Vector2D(length/2, width/2),
-                    Vector2D(length/2, -width/2),
-                    Vector2D(-length/2, -width/2),
-                ]
-            ),
-            # Robot's canon
-            Polygon(
-                Pose2D(
-                    Vector2D(0, 0),
-                    Orient2D(0)
-                ),
-                vertex=[
-                    Vector2D(0, width/20),
-                    Vector2D(length*5/8, width/20),
-                    Vector2D(length*5/8, -width/20),
-                    Vector2D(0, -width/20),
-                ]
-            )
-        ]
+        shape_set = robot_shapes(length, width)
         GameObject.__init__(self, pose, velocity, acceleration, shape_set)
         self.length = length
         self.width = width
+        # Body rectangle for the exact robot-robot test, see body_box()
+        self.body = OrientedBox(
+            pose.position.x, pose.position.y, length/2, width/2,
+            pose.orientation.z
+        )
         self.id = robot_id
         self.health = health
         self.cancelled_damage = 0
@@ -310,7 +364,9 @@ class Robot(GameObject):
     
     def update(self, t_interval=0.02):
         super(Robot, self).update(t_interval)
-       
+        self.update_buffs()
+
+    def update_buffs(self):
         if self.cancelled_damage != 0:
             now = time.time()
             if now - self.defence_buff_timer > 30: 
@@ -319,6 +375,14 @@ class Robot(GameObject):
                 self.cancelled_damage = 0
 
 
+    def body_box(self):
+        """The body rectangle at the current pose."""
+        self.body.set_pose(
+            self.pose.position.x, self.pose.position.y,
+            self.pose.orientation.z
+        )
+        return self.body
+
     @property
     def radius(self):
         return math.sqrt((self.length/2)**2 + (self.width/2)**2)
@@ -26,27 +26,23 @@
 
 from tkinter import *
 import math
-from copy import deepcopy
-from physics import Vector2D, Orient2D, Velocity2D
 from game_objects import Bullet, Wall, Robot, Zone, Polygon, Circle
 from game import Game
+from render import SceneRenderer
+from map import MapWatcher
 
 class GameUI:
     font = ('calibri', 50)
     font_color = "#ddd"
 
-    robot_body_color = "#000"
-    health_color_red = "#ff6d6d"
-    health_color_blue = "#3fccff"
-
-    zone_color_red = "#db0000"
-    zone_color_blue = "#0028ba"
     def __init__(self, width, height=None):
         # game setting
         # self.map_config_path = 'map_mini_config.json'
         self.map_config_path = 'map_config.json'
         self.update_time_interval = 0.02
         self.game = Game(self.map_config_path)
+        # Apply edits of the map file while running
+        self.map_watcher = MapWatcher(self.map_config_path)
 
         # tk setup
         self.tk = Tk()
@@ -57,16 +53,13 @@ class GameUI:
         self.win_closing = False
 
         # create canvas
-        if height is None:
-            height = width * self.game.map.height / self.game.map.width
-
-        self.map_scale = min(
-            width / self.game.map.width,
-            height / self.game.map.height
+        self.renderer = SceneRenderer(
+            self.game.map, self.game.robot_top_health, width, height
         )
+        self.map_scale = self.renderer.map_scale
 
-        self.canvas_width = width + 2 * self.game.map.wall_thickness * self.map_scale
-        self.canvas_height = height + 2 * self.game.map.wall_thickness * self.map_scale
+        self.canvas_width = self.renderer.canvas_width
+        self.canvas_height = self.renderer.canvas_height
         self.canvas = Canvas(self.tk, width=self.canvas_width, height=self.canvas_height,
                              bd=0, highlightthickness=0)
         self.canvas.pack()
@@ -143,127 +136,14 @@ class GameUI:
     def clean(self):
         self.canvas.delete("all")
 
-    def real_coord_2_display_coord(self, real_coords):
-        x = real_coords.x * self.map_scale
-        y = (self.game.map.height-real_coords.y) * self.map_scale
-        x += self.game.map.wall_thickness * self.map_scale
-        y += self.game.map.wall_thickness * self.map_scale
-        return Vector2D(x, y)
-
     def draw(self):
-        for obj in self.game.game_objects:
-            color = '#888'
-
-            if type(obj) is Wall:
-                vertex = deepcopy(obj.shape_set[0].vertex)
-                coords = []
-                for v in vertex:
-                    new_v = v.rotate(
-                        obj.pose.orientation.z
-                    )
-                    new_v += obj.pose.position
-                    new_v = self.real_coord_2_display_coord(new_v)
-                    coords.append(new_v.x)
-                    coords.append(new_v.y)
-                self.canvas.create_polygon(coords, fill=color, outline=color)
-
-            elif type(obj) is Zone:
-                if 'R' in obj.id:
-                    color = self.zone_color_red
-                elif 'B' in obj.id:
-                    color = self.zone_color_blue
-
-                vertex = deepcopy(obj.shape_set[0].vertex)
-                vertex[0]+=Vector2D(obj.side_length*0.02, -obj.side_length*0.02)
-                vertex[1]+=Vector2D(-obj.side_length*0.02, -obj.side_length*0.02)
-                vertex[2]+=Vector2D(-obj.side_length*0.02, obj.side_length*0.02)
-                vertex[3]+=Vector2D(obj.side_length*0.02, obj.side_length*0.02)
-
-                coords = []
-                for v in vertex:
-                    new_v = v.rotate(
-                        obj.pose.orientation.z
-                    )
-                    new_v += obj.pose.position
-                    new_v = self.real_coord_2_display_coord(new_v)
-                    coords.append(new_v.x)
-                    coords.append(new_v.y)
-                self.canvas.create_polygon(
-                    coords, fill="", outline=color, width=obj.side_length*0.04*self.map_scale
-                )
-
-
-            elif type(obj) is Robot:
-
-                def draw_healthbar(robot_coords):
-                    self.canvas.create_rectangle(robot_coords, fill="#bbb")
-                    full_length = (robot_coords[2] - 3) - (robot_coords[0] + 3)
-                    actual_length = (obj.health / self.game.robot_top_health) * full_length
-                    health_coords = [
-                        robot_coords[0] + 3, robot_coords[1] + 3,
-                        robot_coords[0] + 3 + actual_length, robot_coords[3] - 3
-                    ]
-                    if obj.id[0] == 'R':
-                        color = self.health_color_red
-                    else:
-                        color = self.health_color_blue
-                    if actual_length > 0:
-                        self.canvas.create_rectangle(health_coords, fill=color, outline=None)
-                    
-                radius = obj.radius * self.map_scale
-                central = obj.pose.position
-                display_c = self.real_coord_2_display_coord(central)
-                color = '#ddd'
-                coords = [
-                    display_c.x-radius, display_c.y-radius,
-                    display_c.x+radius, display_c.y+radius
-                ]
-
-                healthbar_coords = [
-                    coords[0], coords[1] - 5,
-                    coords[2], coords[1] + 15
-                ]
-                self.canvas.create_oval(coords, fill=color, outline=color)
-                
-                color = self.robot_body_color
-
-                if obj.health == 0:
-                    color = '#fff'
-
-                for shape_i in range(len(obj.shape_set)):
-                    if shape_i>0:
-                        if 'R' in obj.id:
-                            color = 'red'
-                        elif 'B' in obj.id:
-                            color = 'blue'
-
-                    vertex = deepcopy(obj.shape_set[shape_i].vertex)
-                    coords = []
-                    for v in vertex:
-                        new_v = v.rotate(
-                            obj.pose.orientation.z
-                        )
-                        new_v += obj.pose.position
-                        new_v = self.real_coord_2_display_coord(new_v)
-                        coords.append(new_v.x)
-                        coords.append(new_v.y)
-                    self.canvas.create_polygon(coords, fill=color, outline=color)
-
-                draw_healthbar(healthbar_coords)
-
-            elif type(obj) is Bullet:
-                radius = obj.radius * self.map_scale
-                central = obj.pose.position
-                display_c = self.real_coord_2_display_coord(central)
-                if 'R' in obj.team:
-                    color = 'red'
-                if 'B' in obj.team:
-                    color = 'blue'
-                coords = [
-                    display_c.x-radius, display_c.y-radius,
-                    display_c.x+radius, display_c.y+radius,
-                ]
-                self.canvas.create_oval(coords, fill=color, outline=color)
+        for kind, coords, options in self.renderer.draw(self.game.game_objects):
+            if kind == 'polygon':
+                self.canvas.create_polygon(coords, **options)
+            elif kind == 'oval':
+                self.canvas.create_oval(coords, **options)
+            elif kind == 'rectangle':
+                self.canvas.create_rectangle(coords, **options)
 
 
 
@@ -312,6 +192,13 @@ class GameUI:
         self.tk.destroy()
 
     def update(self):
+        # Reload edited map
+        if self.map_watcher.poll():
+            try:
+                print("map reloaded: {:}".format(self.game.reload_map()))
+            except (ValueError, KeyError) as e:
+                print("map reload failed: {:}".format(e))
+
         # Update game
         self.game.update(self.update_time_interval)
 
@@ -325,24 +212,27 @@ class GameUI:
         self.debug_text_id = self.show_debug_text(
             self.debug_text_id, str(self.pressing_keys)
         )
-        for key, value in self.key_dict.items():
-            new_v = Vector2D(0, 0)
-            new_angular = 0
-            if value[0] in self.pressing_keys:
-                new_v.x += 1000
-            if value[1] in self.pressing_keys:
-                new_v.x -= 1000
-            if value[2] in self.pressing_keys:
-                new_v.y += 1000
-            if value[3] in self.pressing_keys:
-                new_v.y -= 1000
-            if value[4] in self.pressing_keys:
-                new_angular += math.pi
-            if value[5] in self.pressing_keys:
-                new_angular -= math.pi
-            for obj in self.game.game_objects:
-                if type(obj) is Robot and obj.id==key:
-                    obj.velocity = Velocity2D(new_v, Orient2D(new_angular))
+        actions = []
+        for robot in self.game.robots:
+            linear_x = 0
+            linear_y = 0
+            angular_z = 0
+            value = self.key_dict.get(robot.id, ())
+            if value:
+                if value[0] in self.pressing_keys:
+                    linear_x += 1000
+                if value[1] in self.pressing_keys:
+                    linear_x -= 1000
+                if value[2] in self.pressing_keys:
+                    linear_y += 1000
+                if value[3] in self.pressing_keys:
+                    linear_y -= 1000
+                if value[4] in self.pressing_keys:
+                    angular_z += math.pi
+                if value[5] in self.pressing_keys:
+                    angular_z -= math.pi
+            actions.append((linear_x, linear_y, angular_z, 0))
+        self.game.apply_actions(actions)
 
         # new_v = Vector2D(0, 0)
         # new_angular = 0
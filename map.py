@@ -23,6 +23,9 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import os
+import time
+
 
 class Map:
     """The game map object representation"""
@@ -38,3 +41,39 @@ class Map:
         self.width = width
         self.height = height
         self.wall_thickness = wall_thickness
+
+
+class MapWatcher:
+    """Polls a map config file for changes."""
+
+    def __init__(self, path, interval=0.5):
+        """Map watcher constructor.
+
+        Args:
+            path (:obj:`str`): The map config JSON file.
+            interval (:obj:`int or float`): Least seconds between two checks.
+
+        """
+        self.path = path
+        self.interval = interval
+        self._last_check = time.time()
+        self._stamp = self._read_stamp()
+
+    def _read_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def poll(self):
+        """True once after every change of the file."""
+        now = time.time()
+        if now - self._last_check < self.interval:
+            return False
+        self._last_check = now
+        stamp = self._read_stamp()
+        if stamp is None or stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        return True
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 Chenrui Lei
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from game_objects import Bullet
+
+
+class MatchRules:
+    """Decides when a match is over and who won.
+
+    A match ends when
+
+    * a team has no robot with health left (``'elimination'``), the other
+      team wins, or it is a draw if both are out,
+    * ``time_limit`` simulated seconds have passed (``'time_limit'``), or
+    * no robot with health has ammo, no bullet is in flight and no supply
+      zone has supplies left (``'ammo'``).
+
+    In the last two cases the team with more total health wins.
+
+    """
+
+    def __init__(self, time_limit=180, elimination=True, ammo_exhaustion=True):
+        """Match rules constructor.
+
+        Args:
+            time_limit (:obj:`int or float`): Match length in simulated
+                seconds, ``None`` for no limit.
+            elimination (:obj:`bool`): End the match when a team is out.
+            ammo_exhaustion (:obj:`bool`): End the match when nobody can
+                shoot any more.
+
+        """
+        self.time_limit = time_limit
+        self.elimination = elimination
+        self.ammo_exhaustion = ammo_exhaustion
+
+    def outcome(self, game):
+        """Result of the match, or ``None`` while it goes on.
+
+        Returns:
+            :obj:`dict`: ``winner`` ('R', 'B' or 'draw'), ``reason``, the
+            ``tick`` and ``elapsed`` time it ended at and the ``health`` left
+            per team.
+
+        """
+        health = {}
+        alive = set()
+        for robot in game.robots:
+            team = robot.id[0]
+            health[team] = health.get(team, 0) + robot.health
+            if robot.health > 0:
+                alive.add(team)
+
+        reason = None
+        winner = None
+        if self.elimination and len(alive) < len(health):
+            reason = 'elimination'
+            winner = alive.pop() if alive else 'draw'
+        elif self.time_limit is not None and game.elapsed >= self.time_limit:
+            reason = 'time_limit'
+        elif self.ammo_exhaustion and self._out_of_ammo(game):
+            reason = 'ammo'
+        if reason is None:
+            return None
+
+        if winner is None:
+            ranked = sorted(health.items(), key=lambda item: -item[1])
+            if len(ranked) > 1 and ranked[0][1] == ranked[1][1]:
+                winner = 'draw'
+            else:
+                winner = ranked[0][0]
+        return {
+            'winner': winner,
+            'reason': reason,
+            'tick': game.tick,
+            'elapsed': game.elapsed,
+            'health': health
+        }
+
+    def _out_of_ammo(self, game):
+        for robot in game.robots:
+            if robot.health > 0 and robot.ammo > 0:
+                return False
+        for obj in game.dynamic_objects:
+            if type(obj) is Bullet:
+                return False
+        for zone in game.zones:
+            if zone.type == 'supply' and zone.supply_times_ready > 0:
+                return False
+        return True
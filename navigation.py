@@ -0,0 +1,466 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 Chenrui Lei
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import heapq
+import math
+from array import array
+from physics import Vector2D
+
+
+class InflatedWall:
+    """A wall rectangle grown by a clearance, stored in the wall's own frame."""
+
+    def __init__(self, wall, clearance):
+        """Inflated wall constructor.
+
+        Args:
+            wall (:obj:`Wall`): The wall to inflate.
+            clearance (:obj:`int or float`): Grow distance in millimeter.
+
+        """
+        self.origin_x = wall.pose.position.x
+        self.origin_y = wall.pose.position.y
+        self.cos = math.cos(wall.pose.orientation.z)
+        self.sin = math.sin(wall.pose.orientation.z)
+        self.xmin = -clearance
+        self.xmax = wall.length + clearance
+        self.ymin = -wall.width - clearance
+        self.ymax = clearance
+
+    def to_local(self, x, y):
+        dx = x - self.origin_x
+        dy = y - self.origin_y
+        return (dx*self.cos + dy*self.sin, -dx*self.sin + dy*self.cos)
+
+    def to_world(self, x, y):
+        return (
+            self.origin_x + x*self.cos - y*self.sin,
+            self.origin_y + x*self.sin + y*self.cos
+        )
+
+    def corners(self, margin=0):
+        return [
+            self.to_world(self.xmin - margin, self.ymin - margin),
+            self.to_world(self.xmax + margin, self.ymin - margin),
+            self.to_world(self.xmax + margin, self.ymax + margin),
+            self.to_world(self.xmin - margin, self.ymax + margin),
+        ]
+
+    def contains(self, x, y):
+        lx, ly = self.to_local(x, y)
+        return self.xmin < lx < self.xmax and self.ymin < ly < self.ymax
+
+    def blocks(self, x1, y1, x2, y2):
+        """Whether the segment passes through the inside of the rectangle.
+
+        Liang-Barsky clipping in the wall frame. Touching the border does not
+        count as blocking, so paths may run along inflated edges.
+
+        """
+        ax, ay = self.to_local(x1, y1)
+        bx, by = self.to_local(x2, y2)
+        dx = bx - ax
+        dy = by - ay
+        t0 = 0.0
+        t1 = 1.0
+        for p, q in ((-dx, ax - self.xmin), (dx, self.xmax - ax),
+                     (-dy, ay - self.ymin), (dy, self.ymax - ay)):
+            if p == 0:
+                if q <= 0:
+                    return False
+            else:
+                t = q / p
+                if p < 0:
+                    t0 = max(t0, t)
+                else:
+                    t1 = min(t1, t)
+                if t1 - t0 <= 1e-9:
+                    return False
+        return True
+
+
+class NavigationGraph:
+    """Visibility graph over the walls inflated by the robot radius.
+
+    Nodes are the zone centers, or the free point nearest to a center that
+    lies inside an inflated wall, and the corners of every inflated wall. The
+    all-pairs shortest paths between them are computed once when the graph
+    is built, so a query only has to connect its start and goal to the
+    nodes they can see.
+
+    """
+
+    corner_margin = 10
+
+    def __init__(self, map, walls, zones, clearance):
+        """Navigation graph constructor.
+
+        Args:
+            map (:obj:`Map`): The game map, used to drop nodes outside of it.
+            walls (:obj:`list` of :obj:`Wall`): The obstacles.
+            zones (:obj:`list` of :obj:`Zone`): Zones whose centers become
+                named nodes.
+            clearance (:obj:`int or float`): Inflation distance in millimeter,
+                usually the largest ``Robot.radius``.
+
+        """
+        self.map = map
+        self.clearance = clearance
+        self.obstacles = [InflatedWall(wall, clearance) for wall in walls]
+
+        self.nodes = []
+        self.zone_nodes = {}
+        self.blocked_zones = []
+        for zone in zones:
+            point = self._zone_point(zone)
+            if point is None:
+                self.blocked_zones.append(zone.id)
+            else:
+                self.zone_nodes[zone.id] = len(self.nodes)
+                self.nodes.append(point)
+        for obstacle in self.obstacles:
+            for x, y in obstacle.corners(self.corner_margin):
+                if self.is_free(x, y):
+                    self.nodes.append((x, y))
+
+        self._build_all_pairs()
+
+    def _zone_point(self, zone, samples=8):
+        """The zone center, or the free point of the zone closest to it when
+        the center is inside an inflated wall. ``None`` if the zone has no
+        free point at all.
+
+        """
+        center = zone.center
+        if self.is_free(center.x, center.y):
+            return center.x, center.y
+        best = None
+        best_d = float('inf')
+        step = zone.side_length / samples
+        for i in range(samples + 1):
+            for j in range(samples + 1):
+                point = zone.pose.position + \
+                    Vector2D(i * step, -j * step).rotate(zone.pose.orientation.z)
+                d = math.hypot(point.x - center.x, point.y - center.y)
+                if d < best_d and self.is_free(point.x, point.y):
+                    best = (point.x, point.y)
+                    best_d = d
+        return best
+
+    def is_free(self, x, y):
+        if not (0 <= x <= self.map.width and 0 <= y <= self.map.height):
+            return False
+        for obstacle in self.obstacles:
+            if obstacle.contains(x, y):
+                return False
+        return True
+
+    def is_visible(self, x1, y1, x2, y2):
+        for obstacle in self.obstacles:
+            if obstacle.blocks(x1, y1, x2, y2):
+                return False
+        return True
+
+    def _build_all_pairs(self):
+        n = len(self.nodes)
+        inf = float('inf')
+        dist = [[inf] * n for _ in range(n)]
+        succ = [[None] * n for _ in range(n)]
+        for i in range(n):
+            dist[i][i] = 0.0
+            succ[i][i] = i
+            xi, yi = self.nodes[i]
+            for j in range(i + 1, n):
+                xj, yj = self.nodes[j]
+                if self.is_visible(xi, yi, xj, yj):
+                    d = math.hypot(xj - xi, yj - yi)
+                    dist[i][j] = dist[j][i] = d
+                    succ[i][j] = j
+                    succ[j][i] = i
+
+        # Floyd-Warshall
+        for k in range(n):
+            dist_k = dist[k]
+            for i in range(n):
+                dist_i = dist[i]
+                d_ik = dist_i[k]
+                if d_ik == inf:
+                    continue
+                succ_i = succ[i]
+                succ_ik = succ_i[k]
+                for j in range(n):
+                    d = d_ik + dist_k[j]
+                    if d < dist_i[j]:
+                        dist_i[j] = d
+                        succ_i[j] = succ_ik
+
+        self.dist = dist
+        self.succ = succ
+
+    def node_path(self, i, j):
+        if self.succ[i][j] is None:
+            return None
+        path = [i]
+        while i != j:
+            i = self.succ[i][j]
+            path.append(i)
+        return path
+
+    def _visible_nodes(self, x, y):
+        visible = []
+        for index, (nx, ny) in enumerate(self.nodes):
+            if self.is_visible(x, y, nx, ny):
+                visible.append((index, math.hypot(nx - x, ny - y)))
+        return visible
+
+    def _as_point(self, point):
+        if isinstance(point, str):
+            if point in self.blocked_zones:
+                raise ValueError(
+                    "Zone {:} is covered by walls inflated by {:} mm, no "
+                    "robot fits in it.".format(point, self.clearance)
+                )
+            x, y = self.nodes[self.zone_nodes[point]]
+            return x, y
+        if isinstance(point, Vector2D):
+            return point.x, point.y
+        return point[0], point[1]
+
+    def plan(self, starts, goals):
+        """Plan paths for a batch of robots in one call.
+
+        Args:
+            starts (:obj:`list`): Start points as :obj:`Vector2D` or
+                ``(x, y)`` tuples.
+            goals (:obj:`list`): One goal per start, as :obj:`Vector2D`,
+                ``(x, y)`` tuples or zone ids.
+
+        Returns:
+            :obj:`list`: One path per start, each a list of :obj:`Vector2D`
+            from start to goal, or ``None`` if the goal is unreachable.
+
+        """
+        if len(starts) != len(goals):
+            raise ValueError(
+                "Got {:} starts but {:} goals.".format(len(starts), len(goals))
+            )
+
+        # Goals are usually shared between robots (zone centers), so connect
+        # every distinct goal to the graph only once per batch.
+        goal_links = {}
+        paths = []
+        for start, goal in zip(starts, goals):
+            sx, sy = self._as_point(start)
+            gx, gy = self._as_point(goal)
+
+            if self.is_visible(sx, sy, gx, gy):
+                paths.append([Vector2D(sx, sy), Vector2D(gx, gy)])
+                continue
+
+            if (gx, gy) not in goal_links:
+                goal_links[(gx, gy)] = self._visible_nodes(gx, gy)
+            end_links = goal_links[(gx, gy)]
+
+            best = float('inf')
+            best_pair = None
+            for i, d_start in self._visible_nodes(sx, sy):
+                dist_i = self.dist[i]
+                for j, d_goal in end_links:
+                    d = d_start + dist_i[j] + d_goal
+                    if d < best:
+                        best = d
+                        best_pair = (i, j)
+
+            if best_pair is None:
+                paths.append(None)
+                continue
+
+            points = [(sx, sy)]
+            for index in self.node_path(*best_pair):
+                points.append(self.nodes[index])
+            points.append((gx, gy))
+            path = [Vector2D(*points[0])]
+            for prev, point in zip(points, points[1:]):
+                if point != prev:
+                    path.append(Vector2D(*point))
+            paths.append(path)
+        return paths
+
+
+class FlowField:
+    """Distance-to-goal and steering direction for every cell of the arena.
+
+    The field is filled by a wavefront (Dijkstra over 8-connected cells)
+    started from all goal cells at once, so each cell points toward its
+    nearest goal. Steering any number of robots is then a plain array lookup.
+
+    """
+
+    def __init__(self, map, obstacles, goal_zones, cell_size=100):
+        """Flow field constructor.
+
+        Args:
+            map (:obj:`Map`): The game map.
+            obstacles (:obj:`list` of :obj:`InflatedWall`): Blocked areas,
+                usually :attr:`NavigationGraph.obstacles`.
+            goal_zones (:obj:`list` of :obj:`Zone`): The zones to flow toward.
+            cell_size (:obj:`int or float`): Cell side length in millimeter.
+
+        """
+        self.cell_size = cell_size
+        self.cols = int(math.ceil(map.width / cell_size))
+        self.rows = int(math.ceil(map.height / cell_size))
+        n = self.cols * self.rows
+
+        blocked = bytearray(n)
+        goals = []
+        for row in range(self.rows):
+            y = (row + 0.5) * cell_size
+            for col in range(self.cols):
+                x = (col + 0.5) * cell_size
+                index = row * self.cols + col
+                if any(obstacle.contains(x, y) for obstacle in obstacles):
+                    blocked[index] = 1
+                elif any(self._zone_contains(zone, x, y) for zone in goal_zones):
+                    goals.append(index)
+
+        inf = float('inf')
+        self.distance = array('d', [inf]) * n
+        self.direction_x = array('f', bytes(4 * n))
+        self.direction_y = array('f', bytes(4 * n))
+        self._wavefront(blocked, goals)
+
+    @staticmethod
+    def _zone_contains(zone, x, y):
+        local = (Vector2D(x, y) - zone.pose.position).rotate(
+            -zone.pose.orientation.z
+        )
+        return 0 <= local.x <= zone.side_length and \
+            -zone.side_length <= local.y <= 0
+
+    def _wavefront(self, blocked, goals):
+        cols = self.cols
+        rows = self.rows
+        distance = self.distance
+        diagonal = math.sqrt(2)
+        steps = [
+            (1, 0, 1.0), (-1, 0, 1.0), (0, 1, 1.0), (0, -1, 1.0),
+            (1, 1, diagonal), (1, -1, diagonal),
+            (-1, 1, diagonal), (-1, -1, diagonal)
+        ]
+
+        heap = []
+        for index in goals:
+            distance[index] = 0.0
+            heap.append((0.0, index))
+        heapq.heapify(heap)
+
+        while heap:
+            d, index = heapq.heappop(heap)
+            if d > distance[index]:
+                continue
+            row, col = divmod(index, cols)
+            for dc, dr, cost in steps:
+                c = col + dc
+                r = row + dr
+                if not (0 <= c < cols and 0 <= r < rows):
+                    continue
+                neighbour = r * cols + c
+                if blocked[neighbour]:
+                    continue
+                # Do not cut blocked corners diagonally
+                if dc and dr and (blocked[row * cols + c] or
+                                  blocked[r * cols + col]):
+                    continue
+                nd = d + cost
+                if nd < distance[neighbour]:
+                    distance[neighbour] = nd
+                    heapq.heappush(heap, (nd, neighbour))
+
+        # Each reachable cell points at its lowest neighbour. Goal cells keep
+        # a zero direction, so robots stop once inside the zone.
+        inf = float('inf')
+        for index in range(cols * rows):
+            d = distance[index]
+            if d == inf or d == 0:
+                continue
+            row, col = divmod(index, cols)
+            best = d
+            best_step = None
+            for dc, dr, _ in steps:
+                c = col + dc
+                r = row + dr
+                if not (0 <= c < cols and 0 <= r < rows):
+                    continue
+                # Same corner rule as the wavefront above
+                if dc and dr and (blocked[row * cols + c] or
+                                  blocked[r * cols + col]):
+                    continue
+                if distance[r * cols + c] < best:
+                    best = distance[r * cols + c]
+                    best_step = (dc, dr)
+            if best_step is not None:
+                norm = math.hypot(*best_step)
+                self.direction_x[index] = best_step[0] / norm
+                self.direction_y[index] = best_step[1] / norm
+
+        for index in range(cols * rows):
+            if distance[index] != inf:
+                distance[index] *= self.cell_size
+
+    def cell_index(self, x, y):
+        """Index of the cell holding a point, clamped to the grid."""
+        col = min(max(int(x // self.cell_size), 0), self.cols - 1)
+        row = min(max(int(y // self.cell_size), 0), self.rows - 1)
+        return row * self.cols + col
+
+    def steer(self, positions):
+        """Look up steering for a batch of positions.
+
+        Args:
+            positions (:obj:`list`): Positions as :obj:`Vector2D` or
+                ``(x, y)`` tuples.
+
+        Returns:
+            :obj:`list`: ``(direction_x, direction_y, distance)`` per
+            position. The direction is a world frame unit vector, or zero in
+            goal and unreachable cells. Unreachable cells have an infinite
+            distance.
+
+        """
+        cell_index = self.cell_index
+        direction_x = self.direction_x
+        direction_y = self.direction_y
+        distance = self.distance
+        result = []
+        for position in positions:
+            if isinstance(position, Vector2D):
+                index = cell_index(position.x, position.y)
+            else:
+                index = cell_index(position[0], position[1])
+            result.append(
+                (direction_x[index], direction_y[index], distance[index])
+            )
+        return result
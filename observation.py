@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 Chenrui Lei
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import math
+import struct
+import time
+from array import array
+from multiprocessing import shared_memory
+
+
+class ObservationBuffer:
+    """Fixed-layout float32 observation of all robots, filled in place.
+
+    The buffer holds one record per robot slot, in the order robots were
+    added to the game. A record is laid out as:
+
+    ``ROBOT_FIELDS``
+        ``x, y, orientation`` in millimeter and radians, ``linear_x,
+        linear_y, angular_z`` robot frame velocity, ``health, ammo,
+        cancelled_damage``, ``buff_time`` seconds since the defence buff
+        started (0 without buff).
+    ``k_bullets`` times ``BULLET_FIELDS``
+        Nearest bullets first. ``valid`` is 1 for a real entry and 0 for
+        padding, ``dx, dy`` is the bullet position relative to the robot,
+        ``vx, vy`` the world frame bullet velocity and ``friendly`` is 1 for
+        bullets fired by the robot's team.
+    ``k_walls`` times ``WALL_FIELDS``
+        Nearest walls first. ``valid`` as above, ``dx, dy`` is the closest
+        wall point relative to the robot and ``distance`` its length.
+
+    All values are native-endian float32. :attr:`view` is a memoryview on
+    the storage, so ``numpy.frombuffer(buffer.view, numpy.float32)`` gives an
+    array without copying. With ``shared_memory_name`` the storage lives in a
+    :obj:`multiprocessing.shared_memory.SharedMemory` block other processes
+    can attach to by name.
+
+    """
+
+    ROBOT_FIELDS = (
+        'x', 'y', 'orientation', 'linear_x', 'linear_y', 'angular_z',
+        'health', 'ammo', 'cancelled_damage', 'buff_time'
+    )
+    BULLET_FIELDS = ('valid', 'dx', 'dy', 'vx', 'vy', 'friendly')
+    WALL_FIELDS = ('valid', 'dx', 'dy', 'distance')
+
+    def __init__(self, robots, walls, k_bullets=4, k_walls=4,
+                 shared_memory_name=None):
+        """Observation buffer constructor.
+
+        Args:
+            robots (:obj:`list` of :obj:`Robot`): Robots in slot order.
+            walls (:obj:`list` of :obj:`Wall`): The walls to observe.
+            k_bullets (:obj:`int`): Bullets recorded per robot.
+            k_walls (:obj:`int`): Walls recorded per robot.
+            shared_memory_name (:obj:`str`): Create the storage as a named
+                shared memory block instead of a private array.
+
+        """
+        self.slots = [robot.id for robot in robots]
+        self.k_bullets = k_bullets
+        self.k_walls = k_walls
+        self.record_size = len(self.ROBOT_FIELDS) + \
+            k_bullets * len(self.BULLET_FIELDS) + \
+            k_walls * len(self.WALL_FIELDS)
+        self._record = struct.Struct('={:}f'.format(self.record_size))
+
+        self.set_walls(walls)
+
+        size = len(self.slots) * self.record_size
+        self.shared_memory = None
+        if shared_memory_name is None:
+            self._storage = array('f', bytes(4 * size))
+            self.view = memoryview(self._storage)
+        else:
+            self.shared_memory = shared_memory.SharedMemory(
+                name=shared_memory_name, create=True, size=max(4 * size, 1)
+            )
+            self._storage = self.shared_memory.buf
+            self.view = self.shared_memory.buf[:4 * size].cast('f')
+
+    def set_walls(self, walls):
+        """Replace the observed walls, e.g. after a map reload."""
+        self._wall_boxes = [wall.box for wall in walls]
+
+    @property
+    def shape(self):
+        return (len(self.slots), self.record_size)
+
+    def offset(self, slot, field):
+        """Float index of a robot field inside the flat buffer."""
+        return slot * self.record_size + self.ROBOT_FIELDS.index(field)
+
+    def fill(self, robots, bullets, hidden=()):
+        """Write the current state of all robots into the buffer.
+
+        Args:
+            robots (:obj:`list` of :obj:`Robot`): Robots in slot order.
+            bullets (:obj:`list` of :obj:`Bullet`): Bullets in flight.
+            hidden (:obj:`set` of :obj:`int`): Slots written as all zeros,
+                e.g. enemies out of sight.
+
+        """
+        now = time.time()
+        bullet_states = []
+        for bullet in bullets:
+            theta = bullet.pose.orientation.z
+            cos = math.cos(theta)
+            sin = math.sin(theta)
+            vx = bullet.velocity.linear.x
+            vy = bullet.velocity.linear.y
+            bullet_states.append((
+                bullet.pose.position.x, bullet.pose.position.y,
+                vx*cos - vy*sin, vx*sin + vy*cos, bullet.team[0]
+            ))
+
+        for slot, robot in enumerate(robots):
+            if slot in hidden:
+                self._record.pack_into(
+                    self._storage, 4 * slot * self.record_size,
+                    *((0.0,) * self.record_size)
+                )
+                continue
+
+            x = robot.pose.position.x
+            y = robot.pose.position.y
+            buff_time = 0.0
+            if robot.cancelled_damage != 0:
+                buff_time = now - robot.defence_buff_timer
+            values = [
+                x, y, robot.pose.orientation.z,
+                robot.velocity.linear.x, robot.velocity.linear.y,
+                robot.velocity.angular.z,
+                robot.health, robot.ammo, robot.cancelled_damage, buff_time
+            ]
+
+            nearest = sorted(
+                bullet_states,
+                key=lambda b: (b[0] - x)**2 + (b[1] - y)**2
+            )[:self.k_bullets]
+            for bx, by, vx, vy, team in nearest:
+                values += (1.0, bx - x, by - y, vx, vy,
+                           1.0 if team == robot.id[0] else 0.0)
+            values += (0.0,) * (len(self.BULLET_FIELDS) *
+                                (self.k_bullets - len(nearest)))
+
+            closest = []
+            for box in self._wall_boxes:
+                wx, wy = box.closest_point(x, y)
+                dx = wx - x
+                dy = wy - y
+                closest.append((math.hypot(dx, dy), dx, dy))
+            closest.sort()
+            closest = closest[:self.k_walls]
+            for distance, dx, dy in closest:
+                values += (1.0, dx, dy, distance)
+            values += (0.0,) * (len(self.WALL_FIELDS) *
+                                (self.k_walls - len(closest)))
+
+            self._record.pack_into(
+                self._storage, 4 * slot * self.record_size, *values
+            )
+
+    def __getstate__(self):
+        # Copies and pickles always get a private array, never the shared block
+        state = self.__dict__.copy()
+        for key in ('_record', '_storage', 'view', 'shared_memory'):
+            del state[key]
+        state['_data'] = self.view.tobytes()
+        return state
+
+    def __setstate__(self, state):
+        data = state.pop('_data')
+        self.__dict__.update(state)
+        self._record = struct.Struct('={:}f'.format(self.record_size))
+        self._storage = array('f')
+        self._storage.frombytes(data)
+        self.view = memoryview(self._storage)
+        self.shared_memory = None
+
+    def close(self):
+        """Release the shared memory block, if any."""
+        if self.shared_memory is not None:
+            self.view.release()
+            self.shared_memory.close()
+            self.shared_memory.unlink()
+            self.shared_memory = None
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 Chenrui Lei
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from physics import Vector2D
+from game_objects import Bullet, Wall, Robot, Zone
+
+
+class SceneRenderer:
+    """Turns game objects into the draw primitives shown by :obj:`GameUI`.
+
+    A scene is a list of ``(kind, coords, options)`` tuples, where ``kind`` is
+    ``'polygon'``, ``'oval'`` or ``'rectangle'``, ``coords`` is a flat list of
+    display coordinates and ``options`` holds Tk style ``fill``, ``outline``
+    and ``width``. Scenes are plain data, so they can be drawn on a Tk canvas
+    or rasterized offscreen in another process.
+
+    """
+
+    robot_body_color = "#000"
+    health_color_red = "#ff6d6d"
+    health_color_blue = "#3fccff"
+
+    zone_color_red = "#db0000"
+    zone_color_blue = "#0028ba"
+
+    def __init__(self, map, robot_top_health, width, height=None):
+        """Scene renderer constructor.
+
+        Args:
+            map (:obj:`Map`): The game map.
+            robot_top_health (:obj:`int`): Health of a full health bar.
+            width (:obj:`int`): Display width of the arena in pixels.
+            height (:obj:`int`): Display height of the arena in pixels, by
+                default keeps the map aspect ratio.
+
+        """
+        self.map = map
+        self.robot_top_health = robot_top_health
+        if height is None:
+            height = width * map.height / map.width
+
+        self.map_scale = min(
+            width / map.width,
+            height / map.height
+        )
+
+        self.canvas_width = width + 2 * map.wall_thickness * self.map_scale
+        self.canvas_height = height + 2 * map.wall_thickness * self.map_scale
+
+    def real_coord_2_display_coord(self, real_coords):
+        x = real_coords.x * self.map_scale
+        y = (self.map.height-real_coords.y) * self.map_scale
+        x += self.map.wall_thickness * self.map_scale
+        y += self.map.wall_thickness * self.map_scale
+        return Vector2D(x, y)
+
+    def _display_coords(self, vertex, pose):
+        coords = []
+        for v in vertex:
+            new_v = v.rotate(
+                pose.orientation.z
+            )
+            new_v += pose.position
+            new_v = self.real_coord_2_display_coord(new_v)
+            coords.append(new_v.x)
+            coords.append(new_v.y)
+        return coords
+
+    def draw(self, game_objects):
+        """Build the scene of a list of game objects."""
+        scene = []
+        for obj in game_objects:
+            color = '#888'
+
+            if type(obj) is Wall:
+                coords = self._display_coords(obj.shape_set[0].vertex, obj.pose)
+                scene.append(('polygon', coords, {'fill': color, 'outline': color}))
+
+            elif type(obj) is Zone:
+                if 'R' in obj.id:
+                    color = self.zone_color_red
+                elif 'B' in obj.id:
+                    color = self.zone_color_blue
+
+                vertex = list(obj.shape_set[0].vertex)
+                vertex[0]+=Vector2D(obj.side_length*0.02, -obj.side_length*0.02)
+                vertex[1]+=Vector2D(-obj.side_length*0.02, -obj.side_length*0.02)
+                vertex[2]+=Vector2D(-obj.side_length*0.02, obj.side_length*0.02)
+                vertex[3]+=Vector2D(obj.side_length*0.02, obj.side_length*0.02)
+
+                coords = self._display_coords(vertex, obj.pose)
+                scene.append(('polygon', coords, {
+                    'fill': "", 'outline': color,
+                    'width': obj.side_length*0.04*self.map_scale
+                }))
+
+            elif type(obj) is Robot:
+                radius = obj.radius * self.map_scale
+                central = obj.pose.position
+                display_c = self.real_coord_2_display_coord(central)
+                color = '#ddd'
+                coords = [
+                    display_c.x-radius, display_c.y-radius,
+                    display_c.x+radius, display_c.y+radius
+                ]
+
+                healthbar_coords = [
+                    coords[0], coords[1] - 5,
+                    coords[2], coords[1] + 15
+                ]
+                scene.append(('oval', coords, {'fill': color, 'outline': color}))
+
+                color = self.robot_body_color
+
+                if obj.health == 0:
+                    color = '#fff'
+
+                for shape_i in range(len(obj.shape_set)):
+                    if shape_i>0:
+                        if 'R' in obj.id:
+                            color = 'red'
+                        elif 'B' in obj.id:
+                            color = 'blue'
+
+                    coords = self._display_coords(
+                        obj.shape_set[shape_i].vertex, obj.pose
+                    )
+                    scene.append(('polygon', coords, {'fill': color, 'outline': color}))
+
+                self._draw_healthbar(scene, obj, healthbar_coords)
+
+            elif type(obj) is Bullet:
+                radius = obj.radius * self.map_scale
+                central = obj.pose.position
+                display_c = self.real_coord_2_display_coord(central)
+                if 'R' in obj.team:
+                    color = 'red'
+                if 'B' in obj.team:
+                    color = 'blue'
+                coords = [
+                    display_c.x-radius, display_c.y-radius,
+                    display_c.x+radius, display_c.y+radius,
+                ]
+                scene.append(('oval', coords, {'fill': color, 'outline': color}))
+        return scene
+
+    def _draw_healthbar(self, scene, robot, robot_coords):
+        scene.append(('rectangle', robot_coords, {'fill': "#bbb"}))
+        full_length = (robot_coords[2] - 3) - (robot_coords[0] + 3)
+        actual_length = (robot.health / self.robot_top_health) * full_length
+        health_coords = [
+            robot_coords[0] + 3, robot_coords[1] + 3,
+            robot_coords[0] + 3 + actual_length, robot_coords[3] - 3
+        ]
+        if robot.id[0] == 'R':
+            color = self.health_color_red
+        else:
+            color = self.health_color_blue
+        if actual_length > 0:
+            scene.append(('rectangle', health_coords, {'fill': color}))
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 Chenrui Lei
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import math
+import pickle
+import struct
+from game import Game
+
+
+class ReplayWriter:
+    """Records a match as keyframes plus per-tick deltas.
+
+    A full :meth:`Game.get_state` keyframe is written every
+    ``keyframe_interval`` ticks. Ticks in between only store what changed:
+    robot fields, zone counters, spawned and removed bullets and the tick's
+    events. Bullets in flight are not stored per tick since they move on a
+    straight line, and a tick without any change is not stored at all, so
+    the file grows with activity rather than with match length.
+
+    File layout: a header record, one record per stored tick, a keyframe
+    index and a trailing ``<Q`` offset of that index. Every record is a
+    ``<I`` byte length followed by a pickle.
+
+    """
+
+    def __init__(self, path, game, keyframe_interval=500, t_interval=0.02):
+        """Replay writer constructor.
+
+        Args:
+            path (:obj:`str`): Output file.
+            game (:obj:`Game`): The recorded game, its current state is the
+                first keyframe.
+            keyframe_interval (:obj:`int`): Ticks between keyframes.
+            t_interval (:obj:`int or float`): The usual simulation step. Ticks
+                simulated with another step store it.
+
+        """
+        self.keyframe_interval = keyframe_interval
+        self.t_interval = t_interval
+        self.index = []
+        self._file = open(path, 'wb')
+        self._write_record({
+            'version': 1,
+            'config_path': game.config_path,
+            'keyframe_interval': keyframe_interval,
+            't_interval': t_interval
+        })
+        self._write_keyframe(game.get_state())
+
+    def _write_record(self, record):
+        data = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+        offset = self._file.tell()
+        self._file.write(struct.pack('<I', len(data)))
+        self._file.write(data)
+        return offset
+
+    def _write_keyframe(self, state):
+        offset = self._write_record(('K', state['tick'], state))
+        self.index.append((state['tick'], offset))
+        self._last = state
+        self._stored_tick = state['tick']
+
+    def record(self, game, t_interval=None):
+        """Record the game right after one :meth:`Game.update`.
+
+        Args:
+            game (:obj:`Game`): The recorded game.
+            t_interval (:obj:`int or float`): The step that update used, if it
+                was not the writer's ``t_interval``.
+
+        """
+        state = game.get_state()
+        if state['tick'] - self.index[-1][0] >= self.keyframe_interval:
+            if game.events:
+                # Keep the events of the tick, set_state ignores them
+                state['events'] = list(game.events)
+            self._write_keyframe(state)
+            return
+
+        last = self._last
+        delta = {}
+        robots = {}
+        for slot, (old, new) in enumerate(zip(last['robots'], state['robots'])):
+            changed = {
+                field: new[field] for field in range(len(new) - 1)
+                if new[field] != old[field]
+            }
+            # buff_age grows every tick, it only matters when the timer restarts
+            if new[-1] < old[-1]:
+                changed[len(new) - 1] = new[-1]
+            if changed:
+                robots[slot] = changed
+        if robots:
+            delta['robots'] = robots
+
+        zones = [
+            zone for zone, old in zip(state['zones'], last['zones'])
+            if zone[3:] != old[3:]
+        ]
+        if zones:
+            delta['zones'] = zones
+
+        old_ids = {bullet[0] for bullet in last['bullets']}
+        new_ids = {bullet[0] for bullet in state['bullets']}
+        spawned = [bullet for bullet in state['bullets'] if bullet[0] not in old_ids]
+        removed = sorted(old_ids - new_ids)
+        if spawned:
+            delta['spawned'] = spawned
+        if removed:
+            delta['removed'] = removed
+        if game.events:
+            delta['events'] = list(game.events)
+        if t_interval is not None and t_interval != self.t_interval:
+            delta['t_interval'] = t_interval
+
+        if delta:
+            delta['next_bullet_id'] = state['next_bullet_id']
+            self._write_record(('D', state['tick'], delta))
+            self._stored_tick = state['tick']
+        self._last = state
+
+    def close(self):
+        if self._last['tick'] != self._stored_tick:
+            # An empty delta marks where a quiet ending stopped
+            self._write_record(('D', self._last['tick'], {
+                'next_bullet_id': self._last['next_bullet_id']
+            }))
+        index_offset = self._write_record(self.index)
+        self._file.write(struct.pack('<Q', index_offset))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def advance_bullets(bullets, t_interval):
+    """Move bullet state tuples one tick, with the same math as GameObject."""
+    moved = []
+    for bullet_id, team, x, y, orientation, linear_x, linear_y, radius in bullets:
+        dx = linear_x * t_interval + (1/2) * 0 * t_interval**2
+        dy = linear_y * t_interval + (1/2) * 0 * t_interval**2
+        cos = math.cos(orientation)
+        sin = math.sin(orientation)
+        moved.append((
+            bullet_id, team, x + dx*cos - dy*sin, y + dx*sin + dy*cos,
+            orientation, linear_x, linear_y, radius
+        ))
+    return moved
+
+
+class ReplayReader:
+    """Random access to a file written by :obj:`ReplayWriter`."""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self.header = self._read_record(0)
+        self.t_interval = self.header['t_interval']
+
+        self._file.seek(-8, 2)
+        index_offset, = struct.unpack('<Q', self._file.read(8))
+        self.index = self._read_record(index_offset)
+        self._index_offset = index_offset
+
+    def _read_record(self, offset=None):
+        if offset is not None:
+            self._file.seek(offset)
+        size, = struct.unpack('<I', self._file.read(4))
+        return pickle.loads(self._file.read(size))
+
+    def records(self):
+        """Iterate over all ``(kind, tick, data)`` tick records in order."""
+        self._file.seek(0)
+        self._read_record()
+        while self._file.tell() < self._index_offset:
+            yield self._read_record()
+
+    @property
+    def last_tick(self):
+        tick = self.index[-1][0]
+        for _, record_tick, _ in self._records_from(self.index[-1][1]):
+            tick = record_tick
+        return tick
+
+    def _records_from(self, offset):
+        self._file.seek(offset)
+        while self._file.tell() < self._index_offset:
+            yield self._read_record()
+
+    def seek(self, tick):
+        """Game state at the end of a tick.
+
+        Loads the nearest keyframe at or before ``tick`` and applies the
+        deltas after it.
+
+        Returns:
+            :obj:`dict`: A state for :meth:`Game.set_state`.
+
+        """
+        keyframe_tick, offset = self.index[0]
+        for index_tick, index_offset in self.index:
+            if index_tick > tick:
+                break
+            keyframe_tick, offset = index_tick, index_offset
+
+        state = None
+        current = keyframe_tick
+        for kind, record_tick, data in self._records_from(offset):
+            if kind == 'K':
+                if record_tick > tick:
+                    break
+                state = dict(data)
+                state['robots'] = list(state['robots'])
+                state['zones'] = list(state['zones'])
+                current = record_tick
+                continue
+            if record_tick > tick:
+                break
+            # Quiet ticks were not stored, only bullets moved during them
+            for _ in range(record_tick - current - 1):
+                state['bullets'] = advance_bullets(state['bullets'], self.t_interval)
+                state['elapsed'] += self.t_interval
+            self._apply_delta(state, data)
+            current = record_tick
+
+        for _ in range(tick - current):
+            state['bullets'] = advance_bullets(state['bullets'], self.t_interval)
+        state['elapsed'] += (tick - current) * self.t_interval
+        state['tick'] = tick
+        return state
+
+    def _apply_delta(self, state, delta):
+        t_interval = delta.get('t_interval', self.t_interval)
+        bullets = advance_bullets(state['bullets'], t_interval)
+        removed = set(delta.get('removed', ()))
+        state['bullets'] = [
+            bullet for bullet in bullets if bullet[0] not in removed
+        ] + delta.get('spawned', [])
+
+        for slot, changed in delta.get('robots', {}).items():
+            robot = list(state['robots'][slot])
+            for field, value in changed.items():
+                robot[field] = value
+            state['robots'][slot] = tuple(robot)
+
+        zones = {zone[0]: zone for zone in delta.get('zones', ())}
+        if zones:
+            state['zones'] = [
+                zones.get(zone[0], zone) for zone in state['zones']
+            ]
+        state['next_bullet_id'] = delta['next_bullet_id']
+        state['elapsed'] += t_interval
+
+    def resume(self, tick):
+        """A live :obj:`Game` continuing from the end of ``tick``."""
+        game = Game(self.header['config_path'])
+        game.set_state(self.seek(tick))
+        return game
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
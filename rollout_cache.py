@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 Chenrui Lei
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import math
+from collections import OrderedDict
+
+
+class RolloutCache:
+    """Transposition cache of planner rollouts.
+
+    Rollouts are keyed on :meth:`Game.state_key`, the actions and the
+    horizon, so near-identical start states share one simulated result.
+
+    """
+
+    def __init__(self, capacity=4096, t_interval=0.02, position_quantum=10,
+                 angle_quantum=math.radians(1), time_quantum=1.0):
+        """Rollout cache constructor.
+
+        Args:
+            capacity (:obj:`int`): Maximum number of cached rollouts. The least
+                recently used entry is evicted first.
+            t_interval (:obj:`int or float`): Simulation step in seconds.
+            position_quantum (:obj:`int or float`): See :meth:`Game.state_key`.
+            angle_quantum (:obj:`float`): See :meth:`Game.state_key`.
+            time_quantum (:obj:`int or float`): See :meth:`Game.state_key`.
+
+        """
+        self.capacity = capacity
+        self.t_interval = t_interval
+        self.quantums = {
+            'position_quantum': position_quantum,
+            'angle_quantum': angle_quantum,
+            'time_quantum': time_quantum
+        }
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def rollout(self, state, actions, ticks):
+        """Simulate ``ticks`` steps from ``state`` or return the cached result.
+
+        Args:
+            state (:obj:`Game`): The start state. It is never modified.
+            actions (:obj:`dict`): Maps robot id to a
+                ``(linear_x, linear_y, angular_z, fire)`` tuple which is held
+                for the whole rollout. The robot fires once at the start if
+                ``fire`` is true.
+            ticks (:obj:`int`): The rollout horizon.
+
+        Returns:
+            :obj:`dict`: Maps robot id to its final
+            ``(x, y, orientation, health, ammo)``.
+
+        """
+        action_key = tuple(sorted(
+            (robot_id, tuple(action)) for robot_id, action in actions.items()
+        ))
+        key = (state.state_key(**self.quantums), action_key, ticks)
+
+        outcome = self._entries.get(key)
+        if outcome is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(outcome)
+
+        self.misses += 1
+        outcome = self._simulate(state, actions, ticks)
+        self._entries[key] = outcome
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+        return dict(outcome)
+
+    def _simulate(self, state, actions, ticks):
+        game = state.fork()
+        rows = []
+        for robot in game.robots:
+            if robot.id in actions:
+                rows.append(actions[robot.id])
+            else:
+                rows.append((
+                    robot.velocity.linear.x, robot.velocity.linear.y,
+                    robot.velocity.angular.z, 0
+                ))
+        game.apply_actions(rows)
+
+        for _ in range(ticks):
+            game.update(self.t_interval, observe=False)
+
+        outcome = {}
+        for robot in game.robots:
+            outcome[robot.id] = (
+                robot.pose.position.x, robot.pose.position.y,
+                robot.pose.orientation.z, robot.health, robot.ammo
+            )
+        return outcome
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return self.hits / lookups
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+            'size': len(self._entries),
+            'capacity': self.capacity
+        }
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 Chenrui Lei
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import argparse
+import os
+import pickle
+import socket
+import struct
+import time
+from collections import OrderedDict
+from multiprocessing import Process, Queue
+from env import GameEnv
+
+
+# Messages are a '<I' byte length followed by a pickle. Pickles run code
+# when loaded, so workers and coordinators must only talk over a trusted
+# network.
+LENGTH = struct.Struct('<I')
+
+
+def send_message(connection, message):
+    data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    connection.sendall(LENGTH.pack(len(data)) + data)
+
+
+def _recv_exactly(connection, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        data += chunk
+    return data
+
+
+def recv_message(connection):
+    size, = LENGTH.unpack(_recv_exactly(connection, LENGTH.size))
+    return pickle.loads(_recv_exactly(connection, size))
+
+
+class RolloutWorker:
+    """Hosts a pool of :obj:`GameEnv` and steps them for a coordinator.
+
+    Requests are ``(session, seq, command, payload)`` tuples and every reply
+    echoes ``seq``. The last ``reply_cache`` replies of the current session
+    are kept, so requests resent after a reconnect are answered again
+    instead of stepping the environments twice. It must be at least the
+    coordinator's ``max_in_flight``. A request of another session, i.e. from
+    a new coordinator, drops them. Environments live as long as the worker,
+    across connections and sessions.
+
+    """
+
+    def __init__(self, n_envs, host='127.0.0.1', port=0, reply_cache=8,
+                 idle_timeout=300, **env_kwargs):
+        """Rollout worker constructor.
+
+        Args:
+            n_envs (:obj:`int`): Environments hosted by this worker.
+            host (:obj:`str`): Interface to listen on.
+            port (:obj:`int`): Port to listen on, 0 picks a free port.
+            reply_cache (:obj:`int`): Number of replies kept for resends.
+            idle_timeout (:obj:`int or float`): Seconds without a request
+                after which a connection is given up, so a coordinator cut
+                off by the network can connect again.
+            **env_kwargs: Passed on to :obj:`GameEnv`.
+
+        """
+        self.envs = [GameEnv(**env_kwargs) for _ in range(n_envs)]
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen()
+        self.address = self.server.getsockname()
+        self.reply_cache = reply_cache
+        self.idle_timeout = idle_timeout
+        self._session = None
+        self._replies = OrderedDict()
+        self.running = True
+
+    def serve_forever(self):
+        while self.running:
+            connection, _ = self.server.accept()
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            connection.settimeout(self.idle_timeout)
+            try:
+                self._serve(connection)
+            except OSError:
+                # Closed, reset or timed out, wait for the next connection
+                pass
+            finally:
+                connection.close()
+        self.server.close()
+
+    def _serve(self, connection):
+        while self.running:
+            session, seq, command, payload = recv_message(connection)
+            if session != self._session:
+                # Sequence numbers start over with every coordinator
+                self._session = session
+                self._replies = OrderedDict()
+            reply = self._replies.get(seq)
+            if reply is None:
+                reply = (seq, self.handle(command, payload))
+                self._replies[seq] = reply
+                if len(self._replies) > self.reply_cache:
+                    self._replies.popitem(last=False)
+            send_message(connection, reply)
+
+    def handle(self, command, payload):
+        if command == 'hello':
+            env = self.envs[0]
+            return {
+                'n_envs': len(self.envs),
+                'observation_space': env.observation_space,
+                'action_space': env.action_space
+            }
+        elif command == 'reset':
+            return [env.reset().tobytes() for env in self.envs]
+        elif command == 'step':
+            results = []
+            for env, action in zip(self.envs, payload):
+                observation, rewards, done, info = env.step(action)
+                info = {
+                    'winner': info['winner'], 'truncated': info['truncated']
+                }
+                if done:
+                    # Start over right away, the final observation goes in info
+                    info['final_observation'] = observation.tobytes()
+                    observation = env.reset()
+                results.append((observation.tobytes(), rewards, done, info))
+            return results
+        elif command == 'close':
+            self.running = False
+            return None
+        raise ValueError("unknown command {:}".format(command))
+
+
+class _WorkerLink:
+    """Coordinator side of one worker connection."""
+
+    def __init__(self, address, timeout):
+        self.address = address
+        self.timeout = timeout
+        self.connection = None
+        self.pending = [] # sent requests without a reply yet, oldest first
+        self.n_envs = 0
+
+    def connect(self):
+        self.connection = socket.create_connection(self.address, self.timeout)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class RolloutCoordinator:
+    """Drives many :obj:`RolloutWorker` over TCP as one batch of environments.
+
+    Environments are numbered worker by worker. :meth:`step_async` sends
+    each worker its slice of the batch without waiting, so all workers step
+    in parallel, and :meth:`step_wait` gathers the replies in order. At most
+    ``max_in_flight`` requests are outstanding per worker, a further send
+    first waits for that worker's oldest reply.
+
+    A broken connection is reopened up to ``reconnect_attempts`` times and
+    unanswered requests are resent; workers answer a repeated request from
+    their reply cache, so nothing is stepped twice.
+
+    """
+
+    def __init__(self, addresses, timeout=30.0, max_in_flight=2,
+                 reconnect_attempts=5, reconnect_delay=0.5):
+        """Rollout coordinator constructor.
+
+        Args:
+            addresses (:obj:`list` of :obj:`tuple`): ``(host, port)`` of every
+                worker.
+            timeout (:obj:`int or float`): Socket timeout in seconds.
+            max_in_flight (:obj:`int`): Outstanding requests per worker, no
+                more than the workers' ``reply_cache``.
+            reconnect_attempts (:obj:`int`): Reconnects tried per failure.
+            reconnect_delay (:obj:`int or float`): Seconds before the first
+                reconnect, doubled after each failed attempt.
+
+        """
+        self.max_in_flight = max_in_flight
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_delay = reconnect_delay
+        self.links = [_WorkerLink(tuple(address), timeout) for address in addresses]
+        # Lets workers tell this coordinator's requests from earlier ones
+        self.session = os.urandom(8).hex()
+        self._seq = 0
+        self.reconnects = 0
+
+        for link in self.links:
+            link.connect()
+        hello = self._broadcast('hello', [None] * len(self.links))
+        for link, info in zip(self.links, hello):
+            link.n_envs = info['n_envs']
+        self.observation_space = hello[0]['observation_space']
+        self.action_space = hello[0]['action_space']
+
+    @property
+    def n_envs(self):
+        return sum(link.n_envs for link in self.links)
+
+    def _send(self, link, command, payload):
+        while len(link.pending) >= self.max_in_flight:
+            self._receive(link)
+        self._seq += 1
+        request = (self.session, self._seq, command, payload)
+        link.pending.append(request)
+        try:
+            send_message(link.connection, request)
+        except OSError:
+            self._reconnect(link)
+
+    def _receive(self, link):
+        while True:
+            try:
+                seq, reply = recv_message(link.connection)
+            except OSError:
+                self._reconnect(link)
+                continue
+            if seq == link.pending[0][1]:
+                link.pending.pop(0)
+                return reply
+
+    def _reconnect(self, link):
+        link.close()
+        delay = self.reconnect_delay
+        for attempt in range(self.reconnect_attempts):
+            time.sleep(delay)
+            delay *= 2
+            try:
+                link.connect()
+                # Resend what was lost; answered requests come from the cache
+                for request in link.pending:
+                    send_message(link.connection, request)
+                self.reconnects += 1
+                return
+            except OSError:
+                link.close()
+        raise ConnectionError("worker {:} is gone".format(link.address))
+
+    def _broadcast(self, command, payloads):
+        for link, payload in zip(self.links, payloads):
+            self._send(link, command, payload)
+        return [self._receive(link) for link in self.links]
+
+    def reset(self):
+        """Reset every environment.
+
+        Returns:
+            :obj:`list` of :obj:`bytes`: One float32 observation per
+            environment.
+
+        """
+        observations = []
+        for reply in self._broadcast('reset', [None] * len(self.links)):
+            observations += reply
+        return observations
+
+    def step_async(self, actions):
+        """Send one action per environment, see :meth:`GameEnv.step`."""
+        if len(actions) != self.n_envs:
+            raise ValueError(
+                "Got {:} actions for {:} environments.".format(
+                    len(actions), self.n_envs
+                )
+            )
+        start = 0
+        for link in self.links:
+            self._send(link, 'step', list(actions[start:start + link.n_envs]))
+            start += link.n_envs
+
+    def step_wait(self):
+        """Gather the oldest outstanding step of every worker.
+
+        Returns:
+            :obj:`tuple`: Lists of observations, rewards, dones and infos,
+            one entry per environment. Finished environments are reset by
+            their worker, see ``info['final_observation']``.
+
+        """
+        observations = []
+        rewards = []
+        dones = []
+        infos = []
+        for link in self.links:
+            for observation, reward, done, info in self._receive(link):
+                observations.append(observation)
+                rewards.append(reward)
+                dones.append(done)
+                infos.append(info)
+        return observations, rewards, dones, infos
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self, stop_workers=False):
+        for link in self.links:
+            if stop_workers:
+                try:
+                    self._send(link, 'close', None)
+                    self._receive(link)
+                except ConnectionError:
+                    pass
+            link.close()
+
+
+def _run_worker(n_envs, env_kwargs, addresses):
+    worker = RolloutWorker(n_envs, **env_kwargs)
+    addresses.put(worker.address)
+    worker.serve_forever()
+
+
+def start_local_workers(n_workers, n_envs, **env_kwargs):
+    """Start workers as local processes, e.g. to test on one machine.
+
+    Returns:
+        :obj:`tuple`: The processes and their ``(host, port)`` addresses.
+
+    """
+    addresses = Queue()
+    processes = []
+    for _ in range(n_workers):
+        process = Process(
+            target=_run_worker, args=(n_envs, env_kwargs, addresses), daemon=True
+        )
+        process.start()
+        processes.append(process)
+    return processes, [addresses.get() for _ in processes]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rollout worker daemon.")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--envs', type=int, default=8)
+    parser.add_argument('--config', default='map_config.json')
+    parser.add_argument('--frame-skip', type=int, default=5)
+    args = parser.parse_args()
+
+    worker = RolloutWorker(
+        args.envs, args.host, args.port,
+        config_path=args.config, frame_skip=args.frame_skip
+    )
+    print("rollout worker with {:} environments on {:}".format(
+        args.envs, worker.address
+    ))
+    worker.serve_forever()
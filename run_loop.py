@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 Chenrui Lei
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import time
+
+
+class RunLoop:
+    """Drives :meth:`Game.update` with a fixed simulation step.
+
+    Three modes share one loop state and one set of statistics:
+
+    ``realtime``
+        Ticks are scheduled against absolute deadlines ``start + n * period``,
+        so the time spent in ``update`` does not add up as drift. A late loop
+        runs up to ``max_catch_up`` ticks back to back. If it is still behind
+        after that the remaining ticks are dropped and the schedule restarts
+        from now, instead of spinning forever to catch up.
+    ``max_speed``
+        A fixed number of ticks without sleeping, for batch jobs.
+    ``step``
+        :meth:`step` advances on demand, for external drivers.
+
+    """
+
+    def __init__(self, game, t_interval=0.02, callback=None):
+        """Run loop constructor.
+
+        Args:
+            game (:obj:`Game`): The game to drive.
+            t_interval (:obj:`int or float`): Simulated seconds per tick.
+            callback (:obj:`callable`): Called with the game after every tick,
+                e.g. a spectator publisher or a replay writer.
+
+        """
+        self.game = game
+        self.t_interval = t_interval
+        self.callback = callback
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.ticks = 0
+        self.overruns = 0 # ticks that started after their deadline
+        self.dropped = 0 # ticks given up by the catch-up limit
+        self.busy_time = 0.0 # seconds spent inside update and callback
+        self._started = None
+        self._stopped = None
+
+    def _tick(self):
+        begin = time.perf_counter()
+        if self._started is None:
+            self._started = begin
+        self.game.update(self.t_interval)
+        if self.callback is not None:
+            self.callback(self.game)
+        end = time.perf_counter()
+        self.busy_time += end - begin
+        self._stopped = end
+        self.ticks += 1
+
+    def step(self, ticks=1):
+        """Advance ``ticks`` ticks right now and return the game."""
+        for _ in range(ticks):
+            self._tick()
+        return self.game
+
+    def run_max_speed(self, ticks, should_stop=None):
+        """Run ``ticks`` ticks back to back.
+
+        Args:
+            ticks (:obj:`int`): Number of ticks.
+            should_stop (:obj:`callable`): Checked with the game before every
+                tick, a true result ends the run early.
+
+        """
+        for _ in range(ticks):
+            if should_stop is not None and should_stop(self.game):
+                break
+            self._tick()
+        return self.stats()
+
+    def run_realtime(self, hz=None, ticks=None, max_catch_up=5,
+                     should_stop=None):
+        """Run at a fixed wall clock rate.
+
+        Args:
+            hz (:obj:`int or float`): Target ticks per second, by default one
+                simulated second per wall clock second.
+            ticks (:obj:`int`): Stop after this many ticks, runs forever by
+                default.
+            max_catch_up (:obj:`int`): Most ticks run without sleeping when
+                the loop is late.
+            should_stop (:obj:`callable`): See :meth:`run_max_speed`.
+
+        """
+        if hz is None:
+            hz = 1 / self.t_interval
+        period = 1 / hz
+        deadline = time.perf_counter()
+        done = 0
+        while ticks is None or done < ticks:
+            if should_stop is not None and should_stop(self.game):
+                break
+
+            now = time.perf_counter()
+            if now < deadline:
+                time.sleep(deadline - now)
+            elif now > deadline and done:
+                # Started late. The first tick starts the schedule, never late
+                self.overruns += 1
+                behind = int((now - deadline) / period)
+                if behind > max_catch_up:
+                    # Give up the backlog and start a fresh schedule
+                    self.dropped += behind - max_catch_up
+                    deadline = now - max_catch_up * period
+
+            self._tick()
+            done += 1
+            deadline += period
+        return self.stats()
+
+    @property
+    def achieved_hz(self):
+        if self._started is None or self._stopped == self._started:
+            return 0.0
+        return self.ticks / (self._stopped - self._started)
+
+    def stats(self):
+        return {
+            'ticks': self.ticks,
+            'achieved_hz': self.achieved_hz,
+            'overruns': self.overruns,
+            'dropped': self.dropped,
+            'busy_time': self.busy_time,
+            'simulated_time': self.ticks * self.t_interval
+        }
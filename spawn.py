@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 Chenrui Lei
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import math
+import random
+from array import array
+from collision import circle_box_contacts
+
+
+class SpawnSet:
+    """All collision-free spawn positions of one robot size, on a grid.
+
+    The engine resolves robots against walls with their bounding circle, so
+    a position is valid when that circle touches no wall and stays inside
+    the map. Validity does not depend on the orientation, which is drawn
+    uniformly when sampling.
+
+    """
+
+    def __init__(self, map, walls, length, width, resolution=50):
+        """Spawn set constructor.
+
+        Args:
+            map (:obj:`Map`): The game map.
+            walls (:obj:`list` of :obj:`Wall`): The walls to keep clear of.
+            length (:obj:`int or float`): Robot length in millimeter.
+            width (:obj:`int or float`): Robot width in millimeter.
+            resolution (:obj:`int or float`): Grid spacing in millimeter.
+
+        """
+        self.radius = math.sqrt((length/2)**2 + (width/2)**2)
+        self.resolution = resolution
+        self.xs = array('f')
+        self.ys = array('f')
+
+        boxes = [wall.box for wall in walls]
+        steps_x = int((map.width - 2*self.radius) // resolution) + 1
+        steps_y = int((map.height - 2*self.radius) // resolution) + 1
+        for i in range(steps_y):
+            y = self.radius + i*resolution
+            for j in range(steps_x):
+                x = self.radius + j*resolution
+                if not circle_box_contacts(x, y, self.radius, boxes):
+                    self.xs.append(x)
+                    self.ys.append(y)
+
+    def __len__(self):
+        return len(self.xs)
+
+    def sample(self, count, rng=random):
+        """Draw ``count`` spawn poses.
+
+        Args:
+            count (:obj:`int`): Number of poses.
+            rng (:obj:`random.Random`): Random source.
+
+        Returns:
+            :obj:`list` of :obj:`tuple`: ``(x, y, orientation)`` per pose.
+
+        """
+        if not self.xs:
+            raise ValueError("No valid spawn position for this robot size.")
+        xs = self.xs
+        ys = self.ys
+        size = len(xs)
+        poses = []
+        for _ in range(count):
+            index = rng.randrange(size)
+            poses.append((xs[index], ys[index], rng.uniform(-math.pi, math.pi)))
+        return poses
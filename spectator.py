@@ -0,0 +1,412 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 Chenrui Lei
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import socket
+import struct
+import sys
+from physics import Vector2D, Orient2D, Pose2D, Velocity2D
+from game_objects import Bullet, Wall, Robot, Zone
+from map import Map
+
+
+# Every packet is a one byte kind and a payload length, followed by the payload
+FRAME_HEADER = struct.Struct('<cI')
+# tick, t_interval, robot records, spawned bullets, removed bullets
+STATE_HEADER = struct.Struct('<IfHHH')
+# slot, x, y, orientation, health, ammo
+ROBOT_RECORD = struct.Struct('<Bffffi')
+# id, shooter slot, x, y, orientation, linear_x, linear_y, radius
+BULLET_RECORD = struct.Struct('<IBffffff')
+REMOVED_RECORD = struct.Struct('<I')
+
+MAP_PACKET = b'M'
+FULL_PACKET = b'F'
+DELTA_PACKET = b'D'
+
+
+def _frame(kind, payload):
+    return FRAME_HEADER.pack(kind, len(payload)) + payload
+
+
+class SpectatorPublisher:
+    """Streams one running game to any number of socket subscribers.
+
+    A new subscriber first gets a map packet with the static walls and
+    zones as JSON, then a full state packet. After that every
+    :meth:`publish` sends one delta packet, holding only robots whose pose,
+    health or ammo changed and the bullets spawned and removed since the
+    last tick. Bullets in flight are not sent, viewers move them
+    themselves. The delta is encoded once and shared by all subscribers.
+
+    Sockets are non-blocking and each subscriber has its own outbox, so a
+    slow viewer never stalls the simulation. A viewer whose outbox grows
+    past ``max_backlog`` bytes is dropped.
+
+    """
+
+    def __init__(self, game, host='127.0.0.1', port=0, max_backlog=1 << 20):
+        """Spectator publisher constructor.
+
+        Args:
+            game (:obj:`Game`): The game to stream.
+            host (:obj:`str`): Interface to listen on.
+            port (:obj:`int`): Port to listen on, 0 picks a free port.
+            max_backlog (:obj:`int`): Unsent bytes after which a subscriber
+                is dropped.
+
+        """
+        self.game = game
+        self.max_backlog = max_backlog
+        self.subscribers = []
+        self.bytes_sent = 0
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen()
+        self.server.setblocking(False)
+        self.address = self.server.getsockname()
+
+        self._slots = {robot.id: slot for slot, robot in enumerate(game.robots)}
+        self._robot_records = [b''] * len(game.robots)
+        self._bullet_ids = set()
+        self._published_tick = game.tick
+        self._map_packet = _frame(MAP_PACKET, self._map_payload())
+
+    def _map_payload(self):
+        game = self.game
+        walls = []
+        zones = []
+        for obj in game.game_objects:
+            if type(obj) is Wall:
+                walls.append((
+                    obj.pose.position.x, obj.pose.position.y,
+                    obj.pose.orientation.z, obj.length, obj.width
+                ))
+            elif type(obj) is Zone:
+                zones.append((
+                    obj.id, obj.type, obj.pose.position.x,
+                    obj.pose.position.y, obj.pose.orientation.z,
+                    obj.side_length
+                ))
+        return json.dumps({
+            'map': (game.map.width, game.map.height, game.map.wall_thickness),
+            'robot_top_health': game.robot_top_health,
+            'walls': walls,
+            'zones': zones,
+            'robots': [
+                (robot.id, robot.length, robot.width) for robot in game.robots
+            ]
+        }).encode('utf-8')
+
+    def _bullet_record(self, bullet):
+        return BULLET_RECORD.pack(
+            bullet.id, self._slots.get(bullet.team, 255),
+            bullet.pose.position.x, bullet.pose.position.y,
+            bullet.pose.orientation.z,
+            bullet.velocity.linear.x, bullet.velocity.linear.y,
+            bullet.radius
+        )
+
+    def _state_payload(self, t_interval, full):
+        robots = []
+        for slot, robot in enumerate(self.game.robots):
+            record = ROBOT_RECORD.pack(
+                slot, robot.pose.position.x, robot.pose.position.y,
+                robot.pose.orientation.z, robot.health, robot.ammo
+            )
+            if full or record != self._robot_records[slot]:
+                robots.append(record)
+            self._robot_records[slot] = record
+
+        bullets = {
+            obj.id: obj for obj in self.game.game_objects if type(obj) is Bullet
+        }
+        if full:
+            spawned = [self._bullet_record(bullet) for bullet in bullets.values()]
+            removed = []
+        else:
+            spawned = [
+                self._bullet_record(bullet) for bullet_id, bullet in bullets.items()
+                if bullet_id not in self._bullet_ids
+            ]
+            removed = [
+                REMOVED_RECORD.pack(bullet_id)
+                for bullet_id in self._bullet_ids if bullet_id not in bullets
+            ]
+        self._bullet_ids = set(bullets)
+
+        return STATE_HEADER.pack(
+            self.game.tick, t_interval, len(robots), len(spawned), len(removed)
+        ) + b''.join(robots) + b''.join(spawned) + b''.join(removed)
+
+    def publish(self, t_interval=0.02):
+        """Send the changes of the last update to all subscribers.
+
+        Args:
+            t_interval (:obj:`int or float`): The step of the last update,
+                viewers use it to move bullets.
+
+        """
+        delta = None
+        if self.game.tick != self._published_tick:
+            delta = _frame(DELTA_PACKET, self._state_payload(t_interval, False))
+            self._published_tick = self.game.tick
+
+        joined = []
+        while True:
+            try:
+                connection, address = self.server.accept()
+            except BlockingIOError:
+                break
+            connection.setblocking(False)
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            joined.append((connection, address))
+        if joined:
+            # The full state must match the tick the delta was taken at
+            full = _frame(FULL_PACKET, self._state_payload(t_interval, True))
+            for connection, address in joined:
+                self.subscribers.append(
+                    [connection, bytearray(self._map_packet + full), address]
+                )
+
+        if delta is not None:
+            # Those who just joined, at the end, got the full state instead
+            for subscriber in self.subscribers[:len(self.subscribers) - len(joined)]:
+                subscriber[1] += delta
+        self.flush()
+
+    def flush(self):
+        """Send as much of every outbox as the sockets accept."""
+        alive = []
+        for subscriber in self.subscribers:
+            connection, outbox, address = subscriber
+            try:
+                if outbox:
+                    sent = connection.send(outbox)
+                    del outbox[:sent]
+                    self.bytes_sent += sent
+            except BlockingIOError:
+                pass
+            except OSError:
+                connection.close()
+                continue
+            if len(outbox) > self.max_backlog:
+                print("spectator {:} is too slow, dropped".format(address))
+                connection.close()
+                continue
+            alive.append(subscriber)
+        self.subscribers = alive
+
+    def close(self):
+        for connection, _, _ in self.subscribers:
+            connection.close()
+        self.subscribers = []
+        self.server.close()
+
+
+class SpectatorClient:
+    """Mirror of a published game, rebuilt from the spectator stream.
+
+    After the map packet :attr:`game_objects` holds walls, zones, robots and
+    bullets in flight, ready for :meth:`SceneRenderer.draw`.
+
+    """
+
+    def __init__(self, host, port, timeout=5.0):
+        self.socket = socket.create_connection((host, port), timeout=timeout)
+        self._inbox = bytearray()
+        self.map = None
+        self.robot_top_health = None
+        self.tick = 0
+        self.static_objects = []
+        self.robots = []
+        self.bullets = {}
+
+        # Wait for the map, everything else arrives through poll()
+        while self.map is None:
+            data = self.socket.recv(65536)
+            if not data:
+                raise ConnectionError("publisher closed the stream")
+            self._inbox += data
+            self._apply_frames()
+        self.socket.setblocking(False)
+
+    @property
+    def game_objects(self):
+        return self.static_objects + self.robots + list(self.bullets.values())
+
+    def poll(self):
+        """Apply all packets received so far.
+
+        Returns:
+            :obj:`int`: Number of state packets applied.
+
+        """
+        while True:
+            try:
+                data = self.socket.recv(65536)
+            except BlockingIOError:
+                break
+            if not data:
+                raise ConnectionError("publisher closed the stream")
+            self._inbox += data
+        return self._apply_frames()
+
+    def _apply_frames(self):
+        applied = 0
+        offset = 0
+        inbox = self._inbox
+        while len(inbox) - offset >= FRAME_HEADER.size:
+            kind, size = FRAME_HEADER.unpack_from(inbox, offset)
+            start = offset + FRAME_HEADER.size
+            if len(inbox) - start < size:
+                break
+            payload = bytes(inbox[start:start + size])
+            offset = start + size
+            if kind == MAP_PACKET:
+                self._apply_map(json.loads(payload.decode('utf-8')))
+            else:
+                self._apply_state(payload, kind == FULL_PACKET)
+                applied += 1
+        del inbox[:offset]
+        return applied
+
+    def _apply_map(self, config):
+        width, height, wall_thickness = config['map']
+        self.map = Map(width, height, wall_thickness)
+        self.robot_top_health = config['robot_top_health']
+        self.static_objects = []
+        for zone_id, zone_type, x, y, theta, side_length in config['zones']:
+            self.static_objects.append(Zone(
+                Pose2D(Vector2D(x, y), Orient2D(theta)),
+                side_length, zone_id, zone_type
+            ))
+        for x, y, theta, length, width in config['walls']:
+            self.static_objects.append(Wall(
+                Pose2D(Vector2D(x, y), Orient2D(theta)), length, width
+            ))
+        self.robots = [
+            Robot(Pose2D(Vector2D(0, 0), Orient2D(0)), length, width, robot_id)
+            for robot_id, length, width in config['robots']
+        ]
+        self.bullets = {}
+
+    def _apply_state(self, payload, full):
+        tick, t_interval, n_robots, n_spawned, n_removed = \
+            STATE_HEADER.unpack_from(payload, 0)
+        offset = STATE_HEADER.size
+
+        if full:
+            self.bullets = {}
+        else:
+            for _ in range(tick - self.tick):
+                for bullet in self.bullets.values():
+                    bullet.update(t_interval)
+        self.tick = tick
+
+        for _ in range(n_robots):
+            slot, x, y, orientation, health, ammo = \
+                ROBOT_RECORD.unpack_from(payload, offset)
+            offset += ROBOT_RECORD.size
+            robot = self.robots[slot]
+            robot.pose.position.x = x
+            robot.pose.position.y = y
+            robot.pose.orientation.z = orientation
+            robot.health = health
+            robot.ammo = ammo
+
+        for _ in range(n_spawned):
+            bullet_id, slot, x, y, orientation, linear_x, linear_y, radius = \
+                BULLET_RECORD.unpack_from(payload, offset)
+            offset += BULLET_RECORD.size
+            team = self.robots[slot].id if slot < len(self.robots) else ''
+            self.bullets[bullet_id] = Bullet(
+                Pose2D(Vector2D(x, y), Orient2D(orientation)),
+                Velocity2D(Vector2D(linear_x, linear_y), Orient2D(0)),
+                team, radius, bullet_id
+            )
+
+        for _ in range(n_removed):
+            bullet_id, = REMOVED_RECORD.unpack_from(payload, offset)
+            offset += REMOVED_RECORD.size
+            self.bullets.pop(bullet_id, None)
+
+    def close(self):
+        self.socket.close()
+
+
+class SpectatorViewer:
+    """Tk window drawing a :obj:`SpectatorClient`, no simulation of its own."""
+
+    def __init__(self, host, port, width=800, refresh_interval=0.02):
+        from tkinter import Tk, Canvas
+        from render import SceneRenderer
+
+        self.client = SpectatorClient(host, port)
+        self.refresh_interval = refresh_interval
+        self.renderer = SceneRenderer(
+            self.client.map, self.client.robot_top_health, width
+        )
+
+        self.tk = Tk()
+        self.tk.title("ICRA 2019 2D Simulation - spectator")
+        self.tk.resizable(0, 0)
+        self.canvas = Canvas(
+            self.tk, width=self.renderer.canvas_width,
+            height=self.renderer.canvas_height, bd=0, highlightthickness=0
+        )
+        self.canvas.pack()
+
+    def update(self):
+        try:
+            changed = self.client.poll()
+        except ConnectionError:
+            print("publisher closed the stream")
+            self.tk.destroy()
+            return
+        if changed:
+            self.canvas.delete("all")
+            scene = self.renderer.draw(self.client.game_objects)
+            for kind, coords, options in scene:
+                if kind == 'polygon':
+                    self.canvas.create_polygon(coords, **options)
+                elif kind == 'oval':
+                    self.canvas.create_oval(coords, **options)
+                elif kind == 'rectangle':
+                    self.canvas.create_rectangle(coords, **options)
+        self.canvas.after(int(self.refresh_interval*1000), self.update)
+
+    def run(self):
+        self.update()
+        self.tk.mainloop()
+        self.client.close()
+
+
+if __name__ == "__main__":
+    # python spectator.py <host> <port>
+    viewer = SpectatorViewer(sys.argv[1], int(sys.argv[2]))
+    viewer.run()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 Chenrui Lei
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import pytest
+
+from game import Game
+from replay import ReplayWriter, ReplayReader
+
+
+def test_seek_matches_live_game_across_quiet_ticks(tmp_path):
+    path = str(tmp_path / 'match.replay')
+    game = Game('map_config.json')
+    writer = ReplayWriter(path, game, keyframe_interval=50)
+    states = {}
+    for tick in range(200):
+        if tick < 20:
+            # Move and fire, then leave the robots idle for the rest
+            game.apply_actions([(800, 300, 0.5, tick % 4 == 0)] * 4)
+        else:
+            game.apply_actions([(0, 0, 0, 0)] * 4)
+        game.update(0.02)
+        writer.record(game)
+        states[game.tick] = game.get_state()
+    writer.close()
+
+    with ReplayReader(path) as reader:
+        for tick in (1, 20, 25, 49, 50, 51, 120, 199, 200):
+            state = reader.seek(tick)
+            expected = states[tick]
+            assert state['tick'] == expected['tick']
+            assert state['elapsed'] == pytest.approx(expected['elapsed'])
+            for robot, live in zip(state['robots'], expected['robots']):
+                assert robot[:8] == pytest.approx(live[:8])
+            assert [bullet[0] for bullet in state['bullets']] == \
+                [bullet[0] for bullet in expected['bullets']]
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 Chenrui Lei
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from env import GameEnv
+from rollout_worker import start_local_workers, RolloutCoordinator
+
+
+ACTION = [(1000, 500, 1, 0)] * 4
+OTHER_ACTION = [(-500, 800, -1, 1)] * 4
+
+
+def test_reconnect_does_not_step_twice():
+    processes, addresses = start_local_workers(2, 1)
+    coordinator = RolloutCoordinator(
+        addresses, max_in_flight=2, reconnect_delay=0.05
+    )
+    try:
+        coordinator.reset()
+        actions = [ACTION] * coordinator.n_envs
+
+        # Two steps in flight on every worker, then the connections break
+        coordinator.step_async(actions)
+        coordinator.step_async(actions)
+        for link in coordinator.links:
+            link.connection.close()
+        coordinator.step_wait()
+        observations, _, _, _ = coordinator.step_wait()
+        observations_3, _, _, _ = coordinator.step(actions)
+
+        reference = GameEnv()
+        reference.reset()
+        reference.step(ACTION)
+        expected = reference.step(ACTION)[0].tobytes()
+        expected_3 = reference.step(ACTION)[0].tobytes()
+
+        assert coordinator.reconnects == 2
+        assert observations == [expected] * coordinator.n_envs
+        assert observations_3 == [expected_3] * coordinator.n_envs
+    finally:
+        coordinator.close(stop_workers=True)
+        for process in processes:
+            process.join(5)
+
+
+def test_new_coordinator_gets_no_cached_replies():
+    processes, addresses = start_local_workers(1, 1)
+    # The same long lived worker, one session after the other
+    first = RolloutCoordinator(addresses)
+    first.reset()
+    first.step([ACTION])
+    first.step([ACTION])
+    first.close()
+    second = RolloutCoordinator(addresses)
+    try:
+        second.reset()
+        observations, _, _, _ = second.step([OTHER_ACTION])
+
+        reference = GameEnv()
+        reference.reset()
+        assert observations == [reference.step(OTHER_ACTION)[0].tobytes()]
+    finally:
+        second.close(stop_workers=True)
+        for process in processes:
+            process.join(5)
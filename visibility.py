@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 Chenrui Lei
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+class TeamVisibility:
+    """Line of sight between robots and bullets, for per-team observations.
+
+    Sight lines are tested against the precomputed wall edges of the
+    collision world in one batch per team. Results are kept for the current
+    tick: a robot-robot sight line is computed once and reused by both teams
+    and by every robot of a team, and a team's visible set is computed once
+    however many of its robots observe.
+
+    """
+
+    def __init__(self, wall_edges):
+        """Team visibility constructor.
+
+        Args:
+            wall_edges (:obj:`WallEdges`): The wall occluders.
+
+        """
+        self.wall_edges = wall_edges
+        self._tick = None
+        self._pairs = {}
+        self._teams = {}
+        self.sight_lines = 0 # segments actually tested, over all ticks
+
+    def _begin_tick(self, tick):
+        if tick != self._tick:
+            self.invalidate()
+            self._tick = tick
+
+    def invalidate(self):
+        """Drop the results of the current tick, e.g. after objects were
+        added or moved within it.
+
+        """
+        self._tick = None
+        self._pairs = {}
+        self._teams = {}
+
+    def visible(self, team, robots, bullets, tick):
+        """Enemy robots and bullets the team can see.
+
+        A team sees everything of its own and every enemy object in line of
+        sight of at least one of its robots with health left.
+
+        Args:
+            team (:obj:`str`): 'R' or 'B'.
+            robots (:obj:`list` of :obj:`Robot`): All robots.
+            bullets (:obj:`list` of :obj:`Bullet`): Bullets in flight.
+            tick (:obj:`int`): The current tick, results are reused until it
+                changes.
+
+        Returns:
+            :obj:`tuple`: Sets of visible robot ids and bullet ids.
+
+        """
+        self._begin_tick(tick)
+        cached = self._teams.get(team)
+        if cached is not None:
+            return cached
+
+        observers = [
+            robot for robot in robots if robot.id[0] == team and robot.health > 0
+        ]
+        visible_robots = {robot.id for robot in robots if robot.id[0] == team}
+        visible_bullets = {
+            bullet.id for bullet in bullets if bullet.team[0] == team
+        }
+
+        # Robot pairs, shared with the other team through self._pairs
+        segments = []
+        keys = []
+        for robot in robots:
+            if robot.id in visible_robots:
+                continue
+            for observer in observers:
+                key = (min(robot.id, observer.id), max(robot.id, observer.id))
+                seen = self._pairs.get(key)
+                if seen is None and key not in keys:
+                    keys.append(key)
+                    segments.append((
+                        observer.pose.position.x, observer.pose.position.y,
+                        robot.pose.position.x, robot.pose.position.y
+                    ))
+        for key, hit in zip(keys, self._first_hits(segments)):
+            self._pairs[key] = hit is None
+        for robot in robots:
+            if robot.id in visible_robots:
+                continue
+            for observer in observers:
+                key = (min(robot.id, observer.id), max(robot.id, observer.id))
+                if self._pairs[key]:
+                    visible_robots.add(robot.id)
+                    break
+
+        # Enemy bullets, one sight line per observer
+        targets = [bullet for bullet in bullets if bullet.id not in visible_bullets]
+        segments = [
+            (
+                observer.pose.position.x, observer.pose.position.y,
+                bullet.pose.position.x, bullet.pose.position.y
+            )
+            for bullet in targets for observer in observers
+        ]
+        hits = self._first_hits(segments)
+        for i, bullet in enumerate(targets):
+            row = hits[i * len(observers):(i + 1) * len(observers)]
+            if any(hit is None for hit in row):
+                visible_bullets.add(bullet.id)
+
+        self._teams[team] = (visible_robots, visible_bullets)
+        return self._teams[team]
+
+    def _first_hits(self, segments):
+        self.sight_lines += len(segments)
+        return self.wall_edges.first_hits(segments)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 Chenrui Lei
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import math
+
+
+class ZoneGrid:
+    """Precomputed zone lookup grid for one robot size.
+
+    ``Zone.is_robot_inside`` checks the robot center against a rectangle that
+    depends on the robot's length and width. Every cell stores the indices of
+    the zones whose rectangle fully covers it and of the zones whose border
+    crosses it, so only border cells need an exact check. Indices rather
+    than zones keep the grid shareable between forked games.
+
+    """
+
+    def __init__(self, map, zones, robot_length, robot_width, cell_size=100):
+        """Zone grid constructor.
+
+        Args:
+            map (:obj:`Map`): The game map.
+            zones (:obj:`list` of :obj:`Zone`): The zones to index.
+            robot_length (:obj:`int or float`): Robot length in millimeter.
+            robot_width (:obj:`int or float`): Robot width in millimeter.
+            cell_size (:obj:`int or float`): Cell side length in millimeter.
+
+        """
+        self.cell_size = cell_size
+        self.width = map.width
+        self.height = map.height
+        self.cols = int(math.ceil(map.width / cell_size))
+        self.rows = int(math.ceil(map.height / cell_size))
+        self.zones = tuple(zones)
+        self.inside = [()] * (self.cols * self.rows)
+        self.border = [()] * (self.cols * self.rows)
+
+        for zone_index, zone in enumerate(zones):
+            # Same bounds as Zone.is_robot_inside
+            xmin = zone.pose.position.x + robot_width/2
+            xmax = zone.pose.position.x + zone.side_length - robot_width/2
+            ymin = zone.pose.position.y - zone.side_length + robot_length/2
+            ymax = zone.pose.position.y - robot_length/2
+            if xmin >= xmax or ymin >= ymax:
+                continue
+
+            col_lo = max(int(xmin // cell_size), 0)
+            col_hi = min(int(xmax // cell_size), self.cols - 1)
+            row_lo = max(int(ymin // cell_size), 0)
+            row_hi = min(int(ymax // cell_size), self.rows - 1)
+            for row in range(row_lo, row_hi + 1):
+                y0 = row * cell_size
+                y1 = y0 + cell_size
+                for col in range(col_lo, col_hi + 1):
+                    x0 = col * cell_size
+                    x1 = x0 + cell_size
+                    index = row * self.cols + col
+                    if x0 > xmin and x1 < xmax and y0 > ymin and y1 < ymax:
+                        self.inside[index] += (zone_index,)
+                    else:
+                        self.border[index] += (zone_index,)
+
+    def cell_index(self, x, y):
+        """Index of the cell at a point, or ``None`` outside of the map."""
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return None
+        return int(y // self.cell_size) * self.cols + int(x // self.cell_size)
+
+
+class ZoneTracker:
+    """Keeps zone membership of robots as enter/exit events.
+
+    A robot's zones are only re-evaluated when it moves to another cell of
+    the :obj:`ZoneGrid`, or while it stands on a cell crossed by a zone
+    border. Zones get ``on_robot_enter``/``on_robot_exit`` calls when the
+    membership changes, and ``update_occupied`` only while occupied.
+
+    """
+
+    def __init__(self, map, zones, cell_size=100):
+        """Zone tracker constructor.
+
+        Args:
+            map (:obj:`Map`): The game map.
+            zones (:obj:`list` of :obj:`Zone`): The zones to track.
+            cell_size (:obj:`int or float`): Lookup grid cell size in
+                millimeter.
+
+        """
+        self.map = map
+        self.zones = list(zones)
+        self.cell_size = cell_size
+        self._grids = {}
+        self._cells = {}
+        self._memberships = {}
+        self._occupied = []
+
+    def grid(self, robot):
+        key = (robot.length, robot.width)
+        if key not in self._grids:
+            self._grids[key] = ZoneGrid(
+                self.map, self.zones, robot.length, robot.width, self.cell_size
+            )
+        return self._grids[key]
+
+    def update(self, robots):
+        """Fire enter/exit events for robots that changed zones.
+
+        Args:
+            robots (:obj:`list` of :obj:`Robot`): Robots still in play.
+
+        """
+        for robot in robots:
+            grid = self.grid(robot)
+            cell = grid.cell_index(robot.pose.position.x, robot.pose.position.y)
+            if cell is not None and cell == self._cells.get(robot.id) and \
+                    not grid.border[cell]:
+                continue
+            self._cells[robot.id] = cell
+
+            zones = self.zones
+            if cell is None:
+                inside = [zone for zone in zones if zone.is_robot_inside(robot)]
+            else:
+                inside = [zones[index] for index in grid.inside[cell]] + [
+                    zones[index] for index in grid.border[cell]
+                    if zones[index].is_robot_inside(robot)
+                ]
+
+            previous = self._memberships.get(robot.id, [])
+            for zone in previous:
+                if zone not in inside:
+                    zone.on_robot_exit(robot)
+                    if not zone.robots:
+                        self._occupied.remove(zone)
+            for zone in inside:
+                if zone not in previous:
+                    zone.on_robot_enter(robot)
+                    if zone not in self._occupied:
+                        self._occupied.append(zone)
+            self._memberships[robot.id] = inside
+
+        for zone in self._occupied:
+            zone.update_occupied()
+
+    def drop(self, robot):
+        """Fire exit events for every zone a robot is in and forget it."""
+        for zone in self._memberships.pop(robot.id, []):
+            zone.on_robot_exit(robot)
+            if not zone.robots:
+                self._occupied.remove(zone)
+        self._cells.pop(robot.id, None)
+
+    def reset(self):
+        """Re-read membership from ``Zone.robots``, e.g. after a state restore."""
+        self._cells = {}
+        self._memberships = {}
+        self._occupied = []
+        for zone in self.zones:
+            for robot in zone.robots:
+                self._memberships.setdefault(robot.id, []).append(zone)
+            if zone.robots:
+                self._occupied.append(zone)
+
+    def fork(self, zones):
+        """Tracker for a forked game, sharing the lookup grids.
+
+        Args:
+            zones (:obj:`list` of :obj:`Zone`): The forked game's zones, in
+                the same order.
+
+        """
+        tracker = ZoneTracker(self.map, zones, self.cell_size)
+        tracker._grids = self._grids
+        tracker.reset()
+        tracker._cells = dict(self._cells)
+        return tracker
+
+    def zones_of(self, robot):
+        return list(self._memberships.get(robot.id, []))